@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from config import Config
+from db import Database
+from models import Fund, Quote
+from utils import configure_logging, parse_date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+log = logging.getLogger()
+
+
+class Analytics():
+    """
+    Vectorized performance metrics for many funds at once.
+
+    Quotes are held in a dates x funds matrix, NaN on days a fund has no
+    quote. Metrics are computed over all funds with NumPy array operations.
+    """
+    TRADING_DAYS = 252
+
+    def __init__(self, fund_ids, dates, prices):
+        if np is None:
+            raise RuntimeError('numpy is required to compute analytics.')
+
+        self.fund_ids = fund_ids
+        self.dates = dates
+        self.prices = prices
+        self.filled = self.forward_fill(prices)
+        self.returns = None
+
+    @classmethod
+    def load(cls, fund_ids=None, start=None, end=None):
+        """ Load quotes of the funds between start and end with a single query """
+        if np is None:
+            raise RuntimeError('numpy is required to compute analytics.')
+
+        query = Quote.select(Quote.fund, Quote.quote_date, Quote.value)
+        if fund_ids:
+            query = query.where(Quote.fund.in_(fund_ids))
+        if start:
+            query = query.where(Quote.quote_date >= start)
+        if end:
+            query = query.where(Quote.quote_date <= end)
+
+        # Skip model instantiation, read raw rows from the cursor
+        rows = Quote.database().execute(query).fetchall()
+        if not rows:
+            empty = np.empty((0, 0))
+            return cls(np.empty(0, dtype=int), np.empty(0, dtype='datetime64[D]'), empty)
+
+        funds, dates, values = zip(*rows)
+        fund_ids, fund_idx = np.unique(np.array(funds), return_inverse=True)
+        dates, date_idx = np.unique(np.array(dates, dtype='datetime64[D]'), return_inverse=True)
+
+        prices = np.full((len(dates), len(fund_ids)), np.nan)
+        prices[date_idx, fund_idx] = np.array(values, dtype=float)
+
+        return cls(fund_ids, dates, prices)
+
+    @staticmethod
+    def forward_fill(values):
+        """ Propagate the last quote of each fund over days without quotes """
+        if values.size == 0:
+            return values.copy()
+
+        rows = np.arange(values.shape[0])[:, None]
+        idx = np.where(np.isnan(values), 0, rows)
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        return values[idx, np.arange(values.shape[1])]
+
+    def daily_returns(self):
+        """ Return of each quote relative to the fund previous quote """
+        if self.returns is None:
+            self.returns = np.full(self.prices.shape, np.nan)
+            self.returns[1:] = self.prices[1:] / self.filled[:-1] - 1
+
+        return self.returns
+
+    def return_moments(self):
+        """ Mean and sample standard deviation of daily returns per fund """
+        returns = self.daily_returns()
+        valid = ~np.isnan(returns)
+        values = np.where(valid, returns, 0.0)
+        count = valid.sum(axis=0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = values.sum(axis=0) / count
+            deviations = np.where(valid, values - mean, 0.0)
+            std = np.sqrt((deviations ** 2).sum(axis=0) / (count - 1))
+
+        return mean, std
+
+    def period_returns(self):
+        """ Return between the first and last quote of each fund """
+        valid = ~np.isnan(self.prices)
+        first = self.prices[valid.argmax(axis=0), np.arange(self.prices.shape[1])]
+        return self.filled[-1] / first - 1
+
+    def volatility(self):
+        """ Annualized standard deviation of daily returns """
+        mean, std = self.return_moments()
+        return std * np.sqrt(self.TRADING_DAYS)
+
+    def rolling_volatility(self, window):
+        """ Annualized volatility over a moving window of days """
+        returns = self.daily_returns()
+        valid = ~np.isnan(returns)
+        values = np.where(valid, returns, 0.0)
+
+        def rolling_sum(a):
+            cumsum = np.cumsum(a, axis=0)
+            cumsum[window:] = cumsum[window:] - cumsum[:-window]
+            return cumsum
+
+        count = rolling_sum(valid.astype(float))
+        total = rolling_sum(values)
+        squares = rolling_sum(values ** 2)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (squares - total ** 2 / count) / (count - 1)
+
+        variance[count < 2] = np.nan
+        return np.sqrt(np.clip(variance, 0, None)) * np.sqrt(self.TRADING_DAYS)
+
+    def max_drawdown(self):
+        """ Largest drop from a previous peak (negative ratio) """
+        peaks = np.fmax.accumulate(self.filled, axis=0)
+        return np.nanmin(self.filled / peaks - 1, axis=0)
+
+    def sharpe(self, risk_free=0.0):
+        """ Annualized Sharpe ratio given an annual risk free rate """
+        mean, std = self.return_moments()
+        excess = mean - risk_free / self.TRADING_DAYS
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return excess / std * np.sqrt(self.TRADING_DAYS)
+
+    def summary(self, risk_free=0.0):
+        """ Metrics per fund as a list of dicts """
+        metrics = {
+            'return': self.period_returns(),
+            'volatility': self.volatility(),
+            'max_drawdown': self.max_drawdown(),
+            'sharpe': self.sharpe(risk_free)
+        }
+
+        return [
+            dict({'fund': int(fund_id)},
+                 **{name: float(values[i]) for name, values in metrics.items()})
+            for i, fund_id in enumerate(self.fund_ids)]
+
+
+if __name__ == '__main__':
+    args = Config.get_args()
+    configure_logging(log, args.verbose, args.log_path, "-fund-quotes-analytics")
+
+    Database()
+    start = parse_date(args.analytics_from).date() if args.analytics_from else None
+    end = parse_date(args.analytics_to).date() if args.analytics_to else None
+
+    with Quote.database().connection_context():
+        analytics = Analytics.load(args.analytics_funds, start, end)
+        names = {f.id: f'{f.bank} {f.name}' for f in Fund.select()}
+
+    print(f'{"Fund":<50} {"Return":>8} {"Vol.":>8} {"Max DD":>8} {"Sharpe":>7}')
+    for row in analytics.summary(args.analytics_risk_free):
+        print(f'{names.get(row["fund"], row["fund"]):<50.50} {row["return"]:>8.2%} '
+              f'{row["volatility"]:>8.2%} {row["max_drawdown"]:>8.2%} {row["sharpe"]:>7.2f}')
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+from functools import wraps
+from timeit import default_timer as timer
+
+from flask import Flask, Response, abort, request
+from cache import LRUCache
+from config import Config
+from db import Database
+from models import DBConfig, Fund, Quote, WebPage
+from utils import configure_logging, parse_date
+
+log = logging.getLogger()
+
+
+class QuoteCache(LRUCache):
+    """ Response cache cleared when a scrapping run commits new quotes """
+
+    def __init__(self, max_size, ttl, check_interval):
+        super().__init__(max_size, ttl)
+        self.check_interval = check_interval
+        self.version = None
+        self.next_check = 0.0
+
+    def check_version(self):
+        """ Clear cache if quotes were updated, at most once per interval """
+        now = timer()
+        if now < self.next_check:
+            return
+
+        self.next_check = now + self.check_interval
+        version = DBConfig.get_quotes_version()
+        if version != self.version:
+            log.debug(f'Quotes updated ({version}), clearing cache.')
+            self.version = version
+            self.clear()
+
+
+def query_date(name):
+    """ Parse optional date query argument """
+    value = request.args.get(name)
+    if not value:
+        return None
+
+    try:
+        return parse_date(value).date()
+    except ValueError:
+        abort(400, f'Invalid "{name}" date: {value}')
+
+
+def quote_conditions(fund_id, after):
+    """ Filter fund quotes by ID offset and optional from/to dates """
+    conditions = (Quote.fund == fund_id) & (Quote.id > after)
+
+    date_from = query_date('from')
+    if date_from:
+        conditions &= (Quote.quote_date >= date_from)
+
+    date_to = query_date('to')
+    if date_to:
+        conditions &= (Quote.quote_date <= date_to)
+
+    return conditions
+
+
+def create_app():
+    args = Config.get_args()
+    app = Flask(__name__)
+    cache = QuoteCache(args.api_cache_size, args.api_cache_ttl, args.api_cache_check)
+
+    def cached(view):
+        """ Serve JSON responses from cache with an ETag """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.full_path
+            with Quote.database().connection_context():
+                cache.check_version()
+                entry = cache.get(key)
+                if entry is None:
+                    body = json.dumps(view(*args, **kwargs), default=str)
+                    entry = (body, WebPage.hash(body))
+                    cache.set(key, entry)
+
+            body, etag = entry
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            return response.make_conditional(request)
+
+        return wrapper
+
+    @app.route('/funds')
+    @cached
+    def funds():
+        query = Fund.select().order_by(Fund.id)
+
+        bank = request.args.get('bank')
+        if bank:
+            query = query.where(Fund.bank == bank)
+
+        return [{
+            'id': fund.id,
+            'name': fund.name,
+            'bank': fund.bank,
+            'start_date': fund.start_date
+        } for fund in query]
+
+    @app.route('/funds/<int:fund_id>/quotes')
+    @cached
+    def fund_quotes(fund_id):
+        if not Fund.select().where(Fund.id == fund_id).exists():
+            abort(404, f'Fund {fund_id} not found.')
+
+        # Keyset pagination: next page starts after the last quote ID
+        after = request.args.get('after', 0, type=int)
+        limit = request.args.get('limit', args.api_page_size, type=int)
+        limit = max(1, min(limit, args.api_page_size))
+
+        query = (Quote
+                 .select(Quote.id, Quote.quote_date, Quote.value)
+                 .where(quote_conditions(fund_id, after))
+                 .order_by(Quote.id)
+                 .limit(limit)
+                 .tuples())
+
+        quotes = [{'id': id, 'date': quote_date, 'value': value}
+                  for id, quote_date, value in query]
+        next_id = quotes[-1]['id'] if quotes and len(quotes) == limit else None
+
+        return {'fund': fund_id, 'quotes': quotes, 'next': next_id}
+
+    @app.route('/quotes/latest')
+    @cached
+    def latest_quotes():
+        query = Quote.latest_per_fund().tuples()
+
+        return [{'id': id, 'fund': fund_id, 'date': quote_date, 'value': value}
+                for id, fund_id, quote_date, value in query]
+
+    return app
+
+
+if __name__ == '__main__':
+    args = Config.get_args()
+    configure_logging(log, args.verbose, args.log_path, "-fund-quotes-api")
+
+    Database()
+    app = create_app()
+    app.run(host=args.api_host, port=args.api_port, threaded=True)
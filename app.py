@@ -1,57 +1,86 @@
-#!/usr/bin/python
-# -*- coding: utf-8 -*-
-
-import logging
-import sys
-from threading import Event, Thread
-
-from utils import configure_logging
-from config import Config
-from db import Database
-
-from funds.cgd import CGD
-
-log = logging.getLogger()
-
-
-class App(Thread):
-
-    __interrupt = Event()
-
-    @staticmethod
-    def interrupt():
-        return App.__interrupt
-
-    def __init__(self):
-        Thread.__init__(self, name='main', daemon=False)
-        self.args = Config.get_args()
-        self.db = Database()
-
-    def run(self):
-        try:
-            self.work()
-        except (KeyboardInterrupt, SystemExit):
-            log.info('Interrupted application.')
-            pass
-        except Exception as e:
-            log.exception(e)
-        finally:
-            self.stop()
-
-        sys.exit(0)
-
-    def work(self):
-        log.debug('Startup')
-        scrapper = CGD()
-        scrapper.run()
-
-    def stop(self):
-        log.debug('Shutdown')
-
-
-if __name__ == '__main__':
-    args = Config.get_args()
-    configure_logging(log, args.verbose, args.log_path, "-fund-quotes")
-
-    app = App()
-    app.start()
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import sys
+from threading import Event, Thread
+
+from utils import configure_logging
+from backfill import Backfill
+from config import Config
+from db import Database
+from orchestrator import Orchestrator
+from replay import Replay
+from scheduler import Scheduler
+from sink import QuoteSink
+
+log = logging.getLogger()
+
+
+class App(Thread):
+
+    __interrupt = Event()
+
+    @staticmethod
+    def interrupt():
+        return App.__interrupt
+
+    def __init__(self):
+        Thread.__init__(self, name='main', daemon=False)
+        self.args = Config.get_args()
+        self.db = Database()
+
+    def run(self):
+        try:
+            self.work()
+        except (KeyboardInterrupt, SystemExit):
+            log.info('Interrupted application.')
+            pass
+        except Exception as e:
+            log.exception(e)
+        finally:
+            self.stop()
+
+        sys.exit(0)
+
+    def work(self):
+        log.debug('Startup')
+        if self.args.backfill:
+            Backfill().run()
+
+        QuoteSink.start_sink()
+        if self.args.replay:
+            Replay(self.args.replay, App.interrupt()).run()
+            return
+
+        orchestrator = Orchestrator(App.interrupt())
+
+        try:
+            if self.args.daemon:
+                scheduler = Scheduler(orchestrator, App.interrupt(), self.db.maintenance)
+                scheduler.run()
+            else:
+                orchestrator.run()
+        finally:
+            orchestrator.close()
+
+    def stop(self):
+        log.debug('Shutdown')
+        App.interrupt().set()
+        QuoteSink.stop_sink()
+
+
+if __name__ == '__main__':
+    args = Config.get_args()
+    configure_logging(log, args.verbose, args.log_path, "-fund-quotes")
+
+    app = App()
+    app.start()
+
+    try:
+        while app.is_alive():
+            app.join(1)
+    except KeyboardInterrupt:
+        log.info('Interrupt received, waiting for scrappers to stop...')
+        App.interrupt().set()
+        app.join()
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+from threading import Lock
+
+from config import Config
+from models import WebPage
+
+log = logging.getLogger(__name__)
+
+
+class PageArchive():
+    """
+    Raw web responses recorded during live runs, to be parsed again offline.
+
+    Bodies are gzip compressed and content addressed, stored once as
+    "<path>/<bank>/<hash>.gz" however many times they are downloaded. Each
+    download is appended to "<path>/<bank>/index.jsonl" with its URL, UTC
+    time and text encoding.
+    """
+    __archive = None
+    __lock = Lock()
+
+    INDEX = 'index.jsonl'
+    EXTENSION = 'gz'
+
+    @staticmethod
+    def get_archive():
+        """ Archive responses are recorded to, None when recording is disabled """
+        with PageArchive.__lock:
+            if PageArchive.__archive is None:
+                args = Config.get_args()
+                if args.archive_path:
+                    PageArchive.__archive = PageArchive(args.archive_path)
+
+        return PageArchive.__archive
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock()
+
+    def bank_path(self, bank):
+        return os.path.join(self.path, bank)
+
+    def filename(self, bank, content_hash):
+        return os.path.join(self.bank_path(bank), f'{content_hash}.{self.EXTENSION}')
+
+    def record(self, bank, url, body, encoding=None):
+        """ Store a response body if it is new and index the download """
+        content_hash = WebPage.hash(body)
+        filename = self.filename(bank, content_hash)
+        entry = {
+            'time': datetime.utcnow().isoformat(),
+            'url': url,
+            'hash': content_hash,
+            'encoding': encoding
+        }
+
+        with self.lock:
+            os.makedirs(self.bank_path(bank), exist_ok=True)
+            if not os.path.exists(filename):
+                # Write to a temporary file, renamed when complete
+                with gzip.open(f'{filename}.part', 'wb') as f:
+                    f.write(body)
+                os.replace(f'{filename}.part', filename)
+
+            with open(os.path.join(self.bank_path(bank), self.INDEX), 'a',
+                      encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+
+        log.debug(f'Archived {url} from {bank} as {content_hash}.')
+        return content_hash
+
+    def entries(self, bank):
+        """ Downloads of a bank in the order they were recorded """
+        filename = os.path.join(self.bank_path(bank), self.INDEX)
+        if not os.path.exists(filename):
+            return []
+
+        entries = []
+        with open(filename, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    entry = json.loads(line)
+                    entry['time'] = datetime.fromisoformat(entry['time'])
+                except (ValueError, KeyError) as e:
+                    log.warning(f'Skipped invalid line {number} of {filename}: {e}')
+                    continue
+                entries.append(entry)
+
+        return entries
+
+    def read(self, bank, entry):
+        """ Archived body of a download decoded as it was when scrapped """
+        with gzip.open(self.filename(bank, entry['hash']), 'rb') as f:
+            body = f.read()
+
+        if entry.get('encoding'):
+            return str(body, entry['encoding'], errors='replace')
+        return body
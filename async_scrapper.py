@@ -0,0 +1,269 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+import os
+import weakref
+import zlib
+from abc import abstractmethod
+from timeit import default_timer as timer
+from urllib.parse import urlparse
+
+from models import WebPage
+from retry import CircuitOpen
+from scrapper import PageNotModified, Scrapper
+from utils import http_headers
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+log = logging.getLogger(__name__)
+
+
+class AsyncScrapper(Scrapper):
+    """
+    Scrapper running on an asyncio event loop.
+
+    Provides coroutine versions of make_request/request_url/download_file
+    backed by aiohttp, with a limit of concurrent requests per host shared
+    by all asynchronous scrappers. Subclasses implement `async def scrap`.
+    """
+    # Semaphores limiting concurrent requests per host, for each event loop
+    __host_limits = weakref.WeakKeyDictionary()
+
+    def is_async(self):
+        return True
+
+    def setup_session(self):
+        # aiohttp sessions must be created inside the event loop
+        self.session = None
+        self.proxy = None
+        self.http_requests = 0
+        self.http_connections = 0
+
+    def setup_proxy(self, no_proxy=False):
+        self.proxy = None
+        if not no_proxy and self.proxy_url:
+            self.proxy = self.proxy_url
+
+    async def open_session(self):
+        if aiohttp is None:
+            raise RuntimeError('aiohttp is required to run asynchronous scrappers.')
+
+        if self.session is None or self.session.closed:
+            timeout = aiohttp.ClientTimeout(total=self.timeout)
+            connector = aiohttp.TCPConnector(
+                limit_per_host=self.pool_size,
+                keepalive_timeout=self.idle_timeout)
+
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(self.on_request_start)
+            trace_config.on_connection_create_end.append(self.on_connection_create)
+
+            self.session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout, trace_configs=[trace_config])
+
+    async def on_request_start(self, session, context, params):
+        self.http_requests += 1
+
+    async def on_connection_create(self, session, context, params):
+        self.http_connections += 1
+
+    def check_idle_connections(self):
+        """
+        Nothing to check, the aiohttp connector is created with
+        keepalive_timeout set to the idle timeout and closes idle
+        connections by itself.
+        """
+
+    def connection_stats(self):
+        return self.http_requests, self.http_connections
+
+    async def close_session(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def host_limit(self, url):
+        """ Semaphore limiting concurrent requests to the URL host """
+        host = urlparse(url).netloc
+        limits = AsyncScrapper.__host_limits.setdefault(asyncio.get_running_loop(), {})
+        if host not in limits:
+            limits[host] = asyncio.Semaphore(self.args.scrapper_host_limit)
+
+        return limits[host]
+
+    async def run_blocking(self, func, *args):
+        """ Run blocking calls, e.g. database queries, in a worker thread """
+        def call():
+            with WebPage.database().connection_context():
+                return func(*args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, call)
+
+    async def make_request(self, url, referer=None, post={}, json=False, cache=False,
+                           timeout=None):
+        await self.open_session()
+        timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+
+        headers = http_headers(keep_alive=True)
+        headers['User-Agent'] = self.user_agent
+        headers['Referer'] = referer or 'https://www.google.com'
+
+        cache = cache and not post
+        if cache:
+            page = await self.run_blocking(WebPage.get_page, url)
+            headers.update(self.conditional_headers(page))
+
+        method = 'POST' if post else 'GET'
+        if post:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        async with self.host_limit(url):
+            async with self.session.request(
+                    method, url, headers=headers, data=post or None,
+                    proxy=self.proxy, timeout=timeout) as response:
+                response.raise_for_status()
+                body = await response.read()
+
+                if cache:
+                    self.check_page(url, page, response.status, response.headers, body)
+
+                if self.archive:
+                    encoding = None if json else response.get_encoding()
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.archive.record, self.name, url, body, encoding)
+
+                if json:
+                    return await response.json()
+
+                return await response.text()
+
+    async def request_url(self, url, referer=None, post={}, json=False, cache=False):
+        retry = self.retry_policy.start(url)
+        while not self.interrupt.is_set():
+            start_t = timer()
+            try:
+                # Last attempt is made without proxy
+                self.setup_proxy(no_proxy=retry.is_last())
+                retry.begin()
+                content = await self.make_request(url, referer, post, json, cache,
+                                                  timeout=retry.timeout(self.timeout))
+                retry.success()
+                return content
+            except PageNotModified:
+                # The host answered
+                retry.success()
+                raise
+            except CircuitOpen as e:
+                log.warning(f'Skipped request to {url}: {e}')
+                return None
+            except Exception as e:
+                self.log_request_error(url, e)
+                delay = retry.failure(e)
+
+            log.debug(f'Request took: {timer()-start_t}')
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+        log.error(f'Failed to scrap webpage after {retry.attempts} attempts: {url}')
+        return None
+
+    async def download_file(self, url, filename, referer=None, use_proxy=False,
+                            decompress=False):
+        """
+        Coroutine version of Scrapper.download_file, content is streamed
+        into "<filename>.part" and renamed once complete.
+        """
+        result = False
+        partial = f'{filename}.part'
+        try:
+            await self.open_session()
+            # Only limit reads, downloads of large files take longer than requests
+            timeout = aiohttp.ClientTimeout(
+                total=None, sock_connect=self.timeout, sock_read=self.timeout)
+
+            headers = http_headers(keep_alive=True)
+            headers['User-Agent'] = self.user_agent
+            headers['Referer'] = referer or 'https://www.google.com'
+
+            offset = 0
+            if not decompress and os.path.exists(partial):
+                offset = os.path.getsize(partial)
+                headers['Range'] = f'bytes={offset}-'
+                # Range offsets must refer to the stored (decoded) content
+                headers['Accept-Encoding'] = 'identity'
+
+            # Concurrent requests may be changing the proxy of the scrapper
+            proxy = self.proxy_url if use_proxy else None
+
+            async with self.host_limit(url):
+                async with self.session.get(
+                        url, headers=headers, proxy=proxy,
+                        timeout=timeout) as response:
+
+                    if offset and response.status == 416:
+                        log.debug(f'Download of {filename} was already complete.')
+                    else:
+                        response.raise_for_status()
+                        await self.write_stream(response, partial, offset, decompress)
+
+            os.replace(partial, filename)
+            result = True
+        except Exception as e:
+            log.exception('Failed to download file "%s": %s.', url, e)
+
+        return result
+
+    async def write_stream(self, response, filename, offset=0, decompress=False):
+        """ Write response content to filename in chunks, off the event loop """
+        if response.status == 206:
+            log.debug(f'Resuming download of {filename} from byte {offset}.')
+            mode = 'ab'
+        else:
+            mode = 'wb'
+
+        # Detect gzip or zlib headers automatically
+        decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS) if decompress else None
+
+        loop = asyncio.get_running_loop()
+        with open(filename, mode) as fd:
+            async for chunk in response.content.iter_chunked(self.chunk_size):
+                if decompressor:
+                    chunk = decompressor.decompress(chunk)
+                await loop.run_in_executor(None, fd.write, chunk)
+
+            if decompressor:
+                await loop.run_in_executor(None, fd.write, decompressor.flush())
+
+    async def run_async(self):
+        self.begin_run()
+        try:
+            result = await self.scrap()
+            await self.run_blocking(self.finish_run, result)
+        except asyncio.CancelledError:
+            self.status = 'cancelled'
+            self.elapsed = timer() - self.start_t
+            raise
+        except Exception as e:
+            self.fail_run(e)
+
+    def run(self):
+        async def run_once():
+            try:
+                await self.run_async()
+            finally:
+                await self.close_session()
+
+        asyncio.run(run_once())
+
+    @abstractmethod
+    async def scrap(self):
+        """
+        Scrap and store relevant web content.
+        """
+        pass
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import csv
+import glob
+import gzip
+import logging
+import os
+from timeit import default_timer as timer
+
+from config import Config
+from db import Database
+from models import DBConfig, Fund, Quote
+from utils import parse_date
+
+log = logging.getLogger(__name__)
+
+
+class Backfill():
+    """
+    Import historical quotes from CSV files in the download path.
+
+    Files are named "<BANK>-<anything>.csv" (optionally gzipped) and have a
+    header with "fund", "date" and "value" columns, plus an optional "bank"
+    column overriding the bank from the filename. Imported files are renamed
+    with an ".imported" suffix.
+    """
+    # ~20 banks x 60 funds x 10 years of business days is ~3M rows,
+    # loading it in under 5 minutes requires 10k rows/s.
+    TARGET_RATE = 10000
+
+    def __init__(self):
+        self.args = Config.get_args()
+        self.batch_size = Database.BATCH_SIZE
+        self.chunk_size = Database.BATCH_SIZE * 20
+        self.read = 0
+        self.inserted = 0
+        self.start_t = None
+
+    def find_files(self):
+        patterns = ['*.csv', '*.csv.gz']
+        files = []
+        for pattern in patterns:
+            files.extend(glob.glob(os.path.join(self.args.download_path, pattern)))
+
+        return sorted(files)
+
+    def read_file(self, filename):
+        """ Generate (bank, fund, date, value) records from a CSV file """
+        basename = os.path.basename(filename)
+        default_bank = basename.split('-')[0].split('.')[0].upper()
+
+        opener = gzip.open if filename.endswith('.gz') else open
+        with opener(filename, 'rt', encoding='utf-8', newline='') as f:
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                try:
+                    yield (
+                        row.get('bank') or default_bank,
+                        row['fund'].strip(),
+                        parse_date(row['date']),
+                        float(row['value'].strip().replace(',', '.')))
+                except (KeyError, ValueError, AttributeError) as e:
+                    log.warning(f'Skipped {basename} line {line}: {e}')
+
+    def ingest(self, records):
+        """ Store (bank, fund, date, value) records in chunks """
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= self.chunk_size:
+                self.store(chunk)
+                chunk = []
+
+        if chunk:
+            self.store(chunk)
+
+    def store(self, records):
+        banks = {}
+        for bank, name, date, value in records:
+            banks.setdefault(bank, set()).add(name)
+
+        funds = {}
+        for bank, names in banks.items():
+            for name, fund in Fund.get_or_create_many(bank, names).items():
+                funds[(bank, name)] = fund.id
+
+        rows = [{'fund': funds[(bank, name)], 'quote_date': date.date(), 'value': value}
+                for bank, name, date, value in records]
+
+        self.read += len(records)
+        self.inserted += Quote.insert_history(rows, self.batch_size)
+        self.report()
+
+    def report(self):
+        elapsed = timer() - self.start_t
+        rate = self.read / elapsed if elapsed else 0
+        log.info(f'Backfill: {self.read} rows read, {self.inserted} inserted, '
+                 f'{rate:.0f} rows/s.')
+        return rate
+
+    def run(self):
+        files = self.find_files()
+        if not files:
+            log.info('No historical quote files to import.')
+            return 0
+
+        self.start_t = timer()
+        with Quote.database().connection_context():
+            for filename in files:
+                log.info(f'Importing historical quotes from: {filename}')
+                self.ingest(self.read_file(filename))
+                os.replace(filename, f'{filename}.imported')
+
+            if self.inserted:
+                DBConfig.update_quotes_version()
+
+        rate = self.report()
+        if rate < self.TARGET_RATE:
+            log.warning(f'Backfill rate below target of {self.TARGET_RATE} rows/s.')
+
+        return self.inserted
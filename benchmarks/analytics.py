@@ -0,0 +1,56 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Measure analytics computation time over a synthetic dates x funds matrix.
+"""
+
+from argparse import ArgumentParser
+from timeit import default_timer as timer
+
+import numpy as np
+
+from analytics import Analytics
+
+
+def make_prices(funds, days, missing, seed=0):
+    """ Random walk prices with a ratio of missing quotes """
+    rnd = np.random.default_rng(seed)
+    returns = rnd.normal(0.0002, 0.01, size=(days, funds))
+    prices = 10 * np.cumprod(1 + returns, axis=0)
+    prices[rnd.random(size=prices.shape) < missing] = np.nan
+
+    dates = np.arange(days).astype('datetime64[D]')
+    return np.arange(funds), dates, prices
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-f', '--funds', type=int, default=2000,
+                        help='Number of funds. Default: 2000.')
+    parser.add_argument('-d', '--days', type=int, default=2520,
+                        help='Number of days (10 years). Default: 2520.')
+    parser.add_argument('-m', '--missing', type=float, default=0.05,
+                        help='Ratio of missing quotes. Default: 0.05.')
+    parser.add_argument('-w', '--window', type=int, default=21,
+                        help='Rolling volatility window in days. Default: 21.')
+    args = parser.parse_args()
+
+    fund_ids, dates, prices = make_prices(args.funds, args.days, args.missing)
+    print(f'{args.funds} funds x {args.days} days, {args.missing:.0%} missing quotes.')
+
+    start_t = timer()
+    analytics = Analytics(fund_ids, dates, prices)
+    summary = analytics.summary()
+    summary_t = timer() - start_t
+
+    start_t = timer()
+    analytics.rolling_volatility(args.window)
+    rolling_t = timer() - start_t
+
+    print(f'{"summary":>18}: {summary_t * 1000:8.1f} ms ({len(summary)} funds)')
+    print(f'{"rolling volatility":>18}: {rolling_t * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Measure CGD page parsing time and peak memory per HTML parser backend,
+with and without the SoupStrainer limited to fund blocks.
+"""
+
+from argparse import ArgumentParser
+from statistics import median
+from timeit import default_timer as timer
+import tracemalloc
+
+from benchmarks.common import load_fixture, make_scrapper
+from funds.cgd import CGD
+from scrapper import HTML_PARSER
+
+
+def backends():
+    parsers = ['html.parser']
+    if HTML_PARSER != 'html.parser':
+        parsers.append(HTML_PARSER)
+
+    for parser in parsers:
+        yield parser, 'full', None
+        yield parser, 'strainer', CGD.PARSE_ONLY
+
+
+def measure(scrapper, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        start_t = timer()
+        names, quotes = scrapper.parse_quotes(content)
+        timings.append(timer() - start_t)
+
+    tracemalloc.start()
+    scrapper.parse_quotes(content)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return median(timings), peak, len(names)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-p', '--page', default='cgd.html',
+                        help='Fixture page to parse. Default: cgd.html.')
+    parser.add_argument('-r', '--repeat', type=int, default=20,
+                        help='Number of parses per backend. Default: 20.')
+    args = parser.parse_args()
+
+    content = load_fixture(args.page)
+    print(f'Parsing {args.page} ({len(content) / 1024:.1f} KiB), '
+          f'median of {args.repeat} runs.')
+
+    for backend, mode, strainer in backends():
+        scrapper = make_scrapper(CGD)
+        scrapper.parser = backend
+        scrapper.PARSE_ONLY = strainer
+
+        elapsed, peak, funds = measure(scrapper, content, args.repeat)
+        print(f'{backend:>12} {mode:>8}: {elapsed * 1000:8.2f} ms, '
+              f'peak {peak / 1024:8.1f} KiB, {funds} funds')
+
+
+if __name__ == '__main__':
+    main()
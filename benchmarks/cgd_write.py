@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Compare database round trips and wall time of the CGD write path:
+per-row queries vs batched queries.
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from timeit import default_timer as timer
+import re
+
+from bs4 import BeautifulSoup
+
+from benchmarks.common import make_cgd_page, make_scrapper, setup_database
+from funds.cgd import CGD
+from models import Fund, Quote
+
+
+def parse_per_row(scrapper, content):
+    """ Previous CGD.parse implementation: 3 queries per fund """
+    soup = BeautifulSoup(content, 'html.parser')
+    details = soup.find_all('div', 'detalhesFundo')
+
+    for info in details:
+        name = info.find('a', class_='nomeFundo').get_text()
+        fund, is_new = Fund.get_or_create(bank=scrapper.BANK, name=name)
+
+        date = info.find('div', class_='cotacaoDiaLbl').get_text()
+        match = re.search(r'\d{2}\-\d{2}\-\d{4}', date)
+        date = datetime.strptime(match.group(), '%d-%m-%Y')
+        max_age = datetime.utcnow() - timedelta(seconds=scrapper.args.scrapper_frequency)
+
+        recent_quotes = Quote.select().where(
+            Quote.fund == fund,
+            Quote.created > max_age
+        ).count()
+
+        if recent_quotes > 0:
+            continue
+
+        quote = info.find('div', class_="cotacaoDia").get_text()
+        match = re.search(r'([\d\,]+) €', quote)
+        Quote.create(fund=fund, quote_date=date.date(),
+                     value=float(match.group(1).replace(',', '.')))
+
+
+def parse_batched(scrapper, content):
+    scrapper.parse(content)
+
+
+def run(name, func, content, latency):
+    database = setup_database(latency)
+    scrapper = make_scrapper(CGD)
+
+    start_t = timer()
+    func(scrapper, content)
+    elapsed = timer() - start_t
+    quotes = Quote.select().count()
+
+    print(f'{name:>10}: {database.queries:5d} queries, '
+          f'{elapsed * 1000:9.2f} ms, {quotes} quotes stored')
+    database.close()
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-f', '--funds', type=int, default=60,
+                        help='Number of funds in the page. Default: 60.')
+    parser.add_argument('-l', '--latency', type=float, default=0.5,
+                        help='Simulated round trip latency in ms. Default: 0.5.')
+    args = parser.parse_args()
+
+    content = make_cgd_page(args.funds)
+    latency = args.latency / 1000
+
+    print(f'CGD page with {args.funds} funds, {args.latency} ms per round trip.')
+    run('per-row', parse_per_row, content, latency)
+    run('batched', parse_batched, content, latency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Compare random sampling latency of ORDER BY RANDOM() against key probing
+(Quote.get_random) and reservoir sampling as the quote table grows.
+"""
+
+from argparse import ArgumentParser
+from timeit import default_timer as timer
+
+from peewee import fn
+
+from benchmarks.common import setup_database
+from models import Quote
+
+# Quotes of 1000 funds, one per day, with every 10th quote deleted to leave key gaps
+FILL_SQL = '''
+WITH RECURSIVE seq(x) AS (SELECT ? UNION ALL SELECT x + 1 FROM seq WHERE x < ?)
+INSERT INTO quote (id, fund_id, quote_date, value, created)
+SELECT x, x % 1000 + 1, date('2000-01-01', '+' || (x / 1000) || ' days'), 10.0, '2000-01-01'
+FROM seq WHERE x % 10 != 0
+'''
+
+
+def measure(func, repeat):
+    """ Median time of the function calls in ms """
+    times = []
+    for _ in range(repeat):
+        start_t = timer()
+        rows = func()
+        times.append(timer() - start_t)
+    assert rows
+
+    return sorted(times)[len(times) // 2] * 1000
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('-s', '--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000, 5000000],
+                        help='Table sizes in rows. Default: 10000 100000 1000000 5000000.')
+    parser.add_argument('-l', '--limit', type=int, default=10,
+                        help='Sample size. Default: 10.')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Measurements per method and size. Default: 5.')
+    parser.add_argument('--reservoir', action='store_true',
+                        help='Also measure reservoir sampling (full scan).')
+    args = parser.parse_args()
+
+    database = setup_database()
+    methods = {
+        'ORDER BY RANDOM()': lambda: list(
+            Quote.select().order_by(fn.Random()).limit(args.limit)),
+        'key probing': lambda: Quote.get_random(args.limit),
+    }
+    if args.reservoir:
+        methods['reservoir'] = lambda: Quote.sample_stream(args.limit)
+
+    print(f'Sample of {args.limit} quotes, median of {args.repeat} runs.')
+    print(f'{"rows":>10} ' + ' '.join(f'{name:>18}' for name in methods))
+
+    size = 0
+    for target in sorted(args.sizes):
+        database.execute_sql(FILL_SQL, (size + 1, target))
+        size = target
+        rows = Quote.select().count()
+
+        times = [measure(func, args.repeat) for func in methods.values()]
+        print(f'{rows:>10} ' + ' '.join(f'{t:>15.2f} ms' for t in times))
+
+    database.close()
+
+
+if __name__ == '__main__':
+    main()
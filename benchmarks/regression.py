@@ -0,0 +1,295 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark regression suite: CGD page parsing, web requests to a local stub
+server with injected latency and failures, bulk quote writes and the
+application startup, which fails if it imports the scrapper dependencies.
+
+Reports median and 99th percentile latency and throughput of each case and
+compares them with the stored baselines, exiting with an error when both
+the median latency and the throughput of a case are worse than its
+baseline beyond the tolerance, so one noisy measure does not fail the run.
+Baselines are machine specific, store them again with --save. Arguments not known to
+this runner are passed to the application configuration, e.g. to write to
+a scratch MySQL database:
+    python -m benchmarks.regression --only write --db-engine mysql \
+        --db-name bench --db-user bench --db-pass bench
+"""
+
+from argparse import ArgumentParser
+from contextlib import closing
+from datetime import date, datetime, timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import ceil
+from threading import Lock, Thread
+from timeit import default_timer as timer
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import load_fixture, make_cgd_page
+from config import Config
+from db import Database
+from funds.cgd import CGD
+from models import Fund, Quote
+from scrapper import HTML_PARSER
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baselines.json')
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Imported along with the scrappers selected to run, or by other tools
+LAZY_MODULES = ['aiohttp', 'bs4', 'lxml', 'requests', 'numpy', 'pyarrow', 'flask']
+
+# Generated pages are dated so no quote is discarded as too old
+PAGE_DATE = datetime(2024, 1, 15)
+FIXTURE_DATE = datetime(2023, 6, 15)
+BENCH_BANK = 'BENCHMARK'
+
+
+class Case():
+    """ Function timed over repeated runs, each processing a number of units """
+
+    def __init__(self, name, func, units=1, unit='ops', repeat=50):
+        self.name = name
+        self.func = func
+        self.units = units
+        self.unit = unit
+        self.repeat = repeat
+
+    def measure(self, repeat=None):
+        self.func()  # Warm up caches and connections
+        timings = []
+        for _ in range(repeat or self.repeat):
+            start_t = timer()
+            self.func()
+            timings.append(timer() - start_t)
+
+        return {
+            'p50': percentile(timings, 50),
+            'p99': percentile(timings, 99),
+            'throughput': self.units * len(timings) / sum(timings),
+            'unit': self.unit
+        }
+
+
+def percentile(values, q):
+    """ Nearest-rank percentile """
+    values = sorted(values)
+    return values[max(0, ceil(q / 100 * len(values)) - 1)]
+
+
+def parse_cases(args):
+    pages = [('fixture', load_fixture('cgd.html'), FIXTURE_DATE, 20)]
+    for funds, repeat in ((10, 100), (100, 20), (1000, 5)):
+        pages.append((f'{funds}-funds', make_cgd_page(funds, PAGE_DATE), PAGE_DATE, repeat))
+
+    for label, content, now, repeat in pages:
+        func = partial(CGD.parse_content, content, HTML_PARSER, CGD.PARSE_ONLY, now)
+        yield Case(f'parse-cgd-{label}', func, len(content.encode()) / 1024, 'KiB', repeat)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Serves the CGD fixture after a delay, /faulty fails every Nth request with 503 """
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent apart, avoid waiting for delayed ACKs
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        server = self.server
+        failed = False
+        if self.path == '/faulty' and server.failure_every:
+            with server.lock:
+                server.faulty_requests += 1
+                failed = server.faulty_requests % server.failure_every == 0
+
+        time.sleep(server.latency)
+        body = b'' if failed else server.body
+        self.send_response(503 if failed else 200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def request_cases(args):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = Lock()
+    server.latency = args.latency / 1000
+    server.failure_every = round(1 / args.failure_rate) if args.failure_rate > 0 else 0
+    server.faulty_requests = 0
+    server.body = load_fixture('cgd.html').encode()
+    Thread(target=server.serve_forever, name='stub-server', daemon=True).start()
+
+    scrapper = CGD()
+    url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        yield Case('request-url', partial(scrapper.request_url, f'{url}/ok'),
+                   unit='requests', repeat=200)
+        yield Case('request-url-faulty', partial(scrapper.request_url, f'{url}/faulty'),
+                   unit='requests', repeat=200)
+    finally:
+        scrapper.session.close()
+        server.shutdown()
+        server.server_close()
+
+
+def write_cases(args):
+    Database()
+    database = Quote.database()
+    with database.connection_context():
+        funds = Fund.get_or_create_many(BENCH_BANK, [f'Fundo {i:04d}' for i in range(500)])
+        fund_ids = [fund.id for fund in funds.values()]
+        days = 10
+        start = {'day': date(2000, 1, 3)}
+
+        def rows(first_day, value):
+            return [{'fund': fund_id, 'quote_date': first_day + timedelta(days=day),
+                     'value': value}
+                    for fund_id in fund_ids for day in range(days)]
+
+        def insert():
+            Quote.upsert_batch(rows(start['day'], 1.0), Database.BATCH_SIZE)
+            start['day'] += timedelta(days=days)
+
+        def update():
+            Quote.upsert_batch(rows(date(2000, 1, 3), time.time()), Database.BATCH_SIZE)
+
+        try:
+            count = len(fund_ids) * days
+            yield Case(f'write-insert-{args.db_engine}', insert, count, 'quotes', 20)
+            yield Case(f'write-update-{args.db_engine}', update, count, 'quotes', 20)
+        finally:
+            Quote.delete().where(Quote.fund.in_(fund_ids)).execute()
+            Fund.delete().where(Fund.id.in_(fund_ids)).execute()
+
+
+def import_cases(args):
+    """ Import the application in a new interpreter, like a scheduled run """
+    script = f'import sys, app; print(*(m for m in {LAZY_MODULES!r} if m in sys.modules))'
+    command = [sys.executable, '-c', script]
+    loaded = subprocess.run(command, cwd=ROOT_PATH, capture_output=True, text=True,
+                            check=True).stdout.split()
+    if loaded:
+        raise RuntimeError(f'Importing app loads {", ".join(loaded)}, '
+                           'they must be imported lazily.')
+
+    yield Case('import-app', partial(subprocess.run, command, cwd=ROOT_PATH, check=True,
+                                     stdout=subprocess.DEVNULL),
+               unit='imports', repeat=20)
+
+
+GROUPS = {
+    'parse': parse_cases,
+    'request': request_cases,
+    'write': write_cases,
+    'import': import_cases,
+}
+
+
+def configure(app_args, path):
+    """ Application configuration: SQLite database in a temporary directory """
+    sys.argv = [sys.argv[0], '--db-engine', 'sqlite', '--db-name', os.path.join(path, 'bench'),
+                '--log-path', path, '--download-path', path,
+                # Retry injected failures quickly, without opening the circuit
+                '-Sr', '3', '-Sbf', '0.001', '-Sct', '1000000'] + app_args
+    return Config.get_args()
+
+
+def compare(result, baseline, tolerance):
+    """ Relative change from the baseline and whether it is a regression """
+    if not baseline:
+        return '', False
+
+    slower = result['p50'] / baseline['p50'] - 1
+    throughput = result['throughput'] / baseline['throughput'] - 1
+    regression = slower > tolerance and throughput < 1 / (1 + tolerance) - 1
+    return f'{slower * 100:+6.1f}% p50 {throughput * 100:+6.1f}% rate', regression
+
+
+def load_baselines(filename):
+    if not os.path.exists(filename):
+        return {}
+
+    with open(filename, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baselines(filename, baselines):
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument('--only', nargs='*', choices=list(GROUPS), default=list(GROUPS),
+                        help='Benchmark groups to run. Default: all.')
+    parser.add_argument('-r', '--repeat', type=int, default=None,
+                        help='Runs per case. Default: per case, 5 to 200.')
+    parser.add_argument('-l', '--latency', type=float, default=2.0,
+                        help='Stub server response latency in ms. Default: 2.')
+    parser.add_argument('-f', '--failure-rate', type=float, default=0.1,
+                        help='Ratio of failed faulty requests. Default: 0.1.')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown from the baseline. Default: 0.25.')
+    parser.add_argument('-b', '--baselines', default=BASELINES_PATH,
+                        help='Baselines file. Default: benchmarks/baselines.json.')
+    parser.add_argument('--save', action='store_true',
+                        help='Store the results as the new baselines.')
+    args, app_args = parser.parse_known_args()
+
+    # Injected failures are expected, do not report them
+    logging.disable(logging.ERROR)
+
+    path = tempfile.mkdtemp(prefix='fund-quotes-bench-')
+    try:
+        app_config = configure(app_args, path)
+        args.db_engine = app_config.db_engine
+        baselines = load_baselines(args.baselines)
+
+        print(f'{"case":>28} {"p50":>10} {"p99":>10} {"throughput":>18}  vs baseline')
+        results = {}
+        regressions = []
+        for group in args.only:
+            # Close cases on errors too, stopping the stub server
+            with closing(GROUPS[group](args)) as cases:
+                for case in cases:
+                    result = case.measure(args.repeat)
+                    results[case.name] = result
+                    change, regression = compare(result, baselines.get(case.name),
+                                                 args.tolerance)
+                    if regression:
+                        regressions.append(case.name)
+
+                    print(f'{case.name:>28} {result["p50"] * 1000:7.2f} ms '
+                          f'{result["p99"] * 1000:7.2f} ms '
+                          f'{result["throughput"]:8.1f} {case.unit + "/s":<9}  {change}'
+                          f'{" REGRESSION" if regression else ""}')
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    if args.save:
+        baselines.update({name: {key: round(value, 6) if isinstance(value, float) else value
+                                 for key, value in result.items()}
+                          for name, result in results.items()})
+        save_baselines(args.baselines, baselines)
+        print(f'Saved {len(results)} baselines to {args.baselines}.')
+    elif regressions:
+        print(f'{len(regressions)} cases regressed more than {args.tolerance:.0%}: '
+              f'{", ".join(regressions)}.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -38,6 +38,9 @@ class Config:
 
     def __check_config(self):
         """ Validate configuration values """
+        if self.__args.db_engine == 'mysql' and not (self.__args.db_user and self.__args.db_pass):
+            raise RuntimeError('MySQL database requires username and password.')
+
         if self.__args.db_max_conn <= 5:
             raise RuntimeError('Database max connections must be greater than 5.')
 
@@ -126,24 +129,62 @@ def get_args():
                         help='Directory where downloaded files are saved.',
                         default='downloads',
                         type=str_path)
+    parser.add_argument('--download-chunk-size',
+                        help=('Size in KiB of the chunks written while '
+                              'downloading files. Default: 1024.'),
+                        default=1024,
+                        type=int)
     parser.add_argument('-ua', '--user-agent',
                         help='Browser User-Agent used. Default: random',
                         choices=['random', 'chrome', 'firefox', 'safari'],
                         default='random')
+    parser.add_argument('--banks',
+                        help=('Banks to scrap, e.g. --banks CGD BPI. '
+                              'Default: all banks in funds/.'),
+                        nargs='*')
+    parser.add_argument('-D', '--daemon',
+                        help=('Keep running and scrap quotes periodically '
+                              'instead of exiting after one cycle.'),
+                        action='store_true')
+    parser.add_argument('-B', '--backfill',
+                        help=('Import historical quotes from CSV files in '
+                              'download path and previous day quotes from '
+                              'bank pages.'),
+                        action='store_true')
+
+    group = parser.add_argument_group('Archive')
+    group.add_argument('--archive-path',
+                       help=('Archive raw web responses, compressed and '
+                             'content addressed, to this directory. '
+                             'Default: None (disabled).'),
+                       default=None,
+                       type=str_path)
+    group.add_argument('--replay',
+                       help=('Parse the web pages archived in this directory '
+                             'instead of scrapping, without network requests.'),
+                       default=None,
+                       type=str_path)
+    group.add_argument('--replay-dry-run',
+                       help='Parse archived pages without storing quotes.',
+                       action='store_true')
 
     group = parser.add_argument_group('Database')
+    group.add_argument('--db-engine',
+                       help=('Database engine, SQLite stores the database in '
+                             'a local file. Default: mysql.'),
+                       choices=['mysql', 'sqlite'],
+                       default='mysql')
     group.add_argument('--db-name',
                        env_var='MYSQL_DATABASE',
-                       help='Name of the database to be used.',
+                       help=('Name of the database to be used, or the file '
+                             'name with SQLite.'),
                        required=True)
     group.add_argument('--db-user',
                        env_var='MYSQL_USER',
-                       help='Username for the database.',
-                       required=True)
+                       help='Username for the database (MySQL only).')
     group.add_argument('--db-pass',
                        env_var='MYSQL_PASSWORD',
-                       help='Password for the database.',
-                       required=True)
+                       help='Password for the database (MySQL only).')
     group.add_argument('--db-host',
                        env_var='MYSQL_HOST',
                        help='IP or hostname for the database.',
@@ -160,12 +201,36 @@ def get_args():
                        env_var='MYSQL_BATCH_SIZE',
                        help='Maximum number of rows to update per batch.',
                        type=int, default=250)
+    group.add_argument('--db-flush-interval',
+                       help=('Maximum seconds scrapped quotes wait in the '
+                             'write-behind buffer. Default: 1.'),
+                       default=1.0,
+                       type=float_seconds)
+    group.add_argument('--db-latest-table',
+                       help=('Build a table with the latest quote of each '
+                             'fund. Once built, every process keeps it updated '
+                             'along with new quotes, with or without this option.'),
+                       action='store_true')
+    group.add_argument('--db-partition',
+                       help=('Partition the quote table by month of the quote '
+                             'date. Removes the quote foreign key constraint.'),
+                       action='store_true')
+    group.add_argument('--db-partition-ahead',
+                       help=('Number of future monthly partitions created '
+                             'ahead of time. Default: 3.'),
+                       default=3,
+                       type=int)
 
     group = parser.add_argument_group('Scrapper')
     group.add_argument('-Sf', '--scrapper-frequency',
                        help='Scrap quotes very X hours. Default: 6.',
-                       default=6,
+                       default='6',
                        type=int_hours)
+    group.add_argument('-Sj', '--scrapper-jitter',
+                       help=('Maximum random delay (in minutes) added to '
+                             'scheduled runs in daemon mode. Default: 5.'),
+                       default='5',
+                       type=int_minutes)
     group.add_argument('-Sr', '--scrapper-retries',
                        help=('Maximum number of web request attempts. '
                              'Default: 5.'),
@@ -176,16 +241,121 @@ def get_args():
                              'until next retry will increase. Default: 1.0.'),
                        default=1.0,
                        type=float_seconds)
+    group.add_argument('-Sb', '--scrapper-budget',
+                       help=('Maximum time in seconds spent on a request, '
+                             'including retries. Default: 60.'),
+                       default=60.0,
+                       type=float_seconds)
+    group.add_argument('-Sct', '--scrapper-breaker-threshold',
+                       help=('Consecutive failures after which requests to a '
+                             'host are suspended. Default: 5.'),
+                       default=5,
+                       type=int)
+    group.add_argument('-Scr', '--scrapper-breaker-timeout',
+                       help=('Seconds requests to a failing host are suspended '
+                             'before probing it again. Default: 300.'),
+                       default=300.0,
+                       type=float_seconds)
     group.add_argument('-St', '--scrapper-timeout',
                        help='Connection timeout in seconds. Default: 5.',
                        default=10.0,
                        type=float_seconds)
+    group.add_argument('-Sps', '--scrapper-pool-size',
+                       help=('Maximum number of persistent connections kept '
+                             'per host. Default: 10.'),
+                       default=10,
+                       type=int)
+    group.add_argument('-Sit', '--scrapper-idle-timeout',
+                       help=('Close persistent connections left idle for X '
+                             'seconds. Default: 60.'),
+                       default=60.0,
+                       type=float_seconds)
+    group.add_argument('-Shl', '--scrapper-host-limit',
+                       help=('Maximum concurrent requests per host made by '
+                             'asynchronous scrappers. Default: 4.'),
+                       default=4,
+                       type=int)
+    group.add_argument('-Spw', '--scrapper-parse-workers',
+                       help=('Processes parsing downloaded pages, 0 parses '
+                             'them in the fetching threads. Default: 2.'),
+                       default=2,
+                       type=int)
+    group.add_argument('-Sq', '--scrapper-queue-size',
+                       help=('Parsed pages waiting to be stored before '
+                             'fetching blocks. Default: 8.'),
+                       default=8,
+                       type=int)
+    group.add_argument('-Spa', '--scrapper-parser',
+                       help=('HTML parser backend, auto uses lxml when '
+                             'installed. Default: auto.'),
+                       choices=['auto', 'lxml', 'html.parser'],
+                       default='auto')
     group.add_argument('-Sp', '--scrapper-proxy',
                        help=('Use this proxy for webpage scrapping. '
                              'Format: <proto>://[<user>:<pass>@]<ip>:<port> '
                              'Default: None.'),
                        default=None)
 
+    group = parser.add_argument_group('API')
+    group.add_argument('--api-host',
+                       help='Interface the quotes API listens on.',
+                       default='127.0.0.1')
+    group.add_argument('--api-port',
+                       help='Port the quotes API listens on. Default: 5000.',
+                       default=5000,
+                       type=int)
+    group.add_argument('--api-page-size',
+                       help='Maximum quotes returned per page. Default: 500.',
+                       default=500,
+                       type=int)
+    group.add_argument('--api-cache-size',
+                       help='Maximum number of cached responses. Default: 1024.',
+                       default=1024,
+                       type=int)
+    group.add_argument('--api-cache-ttl',
+                       help='Seconds responses are kept in cache. Default: 300.',
+                       default=300.0,
+                       type=float_seconds)
+    group.add_argument('--api-cache-check',
+                       help=('Interval in seconds between checks for new '
+                             'quotes invalidating the cache. Default: 5.'),
+                       default=5.0,
+                       type=float_seconds)
+
+    group = parser.add_argument_group('Analytics')
+    group.add_argument('--analytics-funds',
+                       help='Fund IDs to analyse. Default: all.',
+                       nargs='*',
+                       type=int)
+    group.add_argument('--analytics-from',
+                       help='Analyse quotes from this date (YYYY-MM-DD).',
+                       default=None)
+    group.add_argument('--analytics-to',
+                       help='Analyse quotes up to this date (YYYY-MM-DD).',
+                       default=None)
+    group.add_argument('--analytics-risk-free',
+                       help='Annual risk free rate used in Sharpe ratios. Default: 0.0.',
+                       default=0.0,
+                       type=float)
+
+    group = parser.add_argument_group('Export')
+    group.add_argument('--export-path',
+                       help='Directory where quote exports are saved.',
+                       default='exports',
+                       type=str_path)
+    group.add_argument('--export-format',
+                       help=('Export file format, CSV is gzip compressed. '
+                             'Default: parquet.'),
+                       choices=['parquet', 'arrow', 'csv'],
+                       default='parquet')
+    group.add_argument('--export-chunk-size',
+                       help='Quotes read from the database per query. Default: 50000.',
+                       default=50000,
+                       type=int)
+    group.add_argument('--export-full',
+                       help='Export all quotes, replacing the files of previous exports.',
+                       action='store_true')
+
     args = parser.parse_args()
 
     if args.verbose:
@@ -1,143 +1,366 @@
-#!/usr/bin/python
-# -*- coding: utf-8 -*-
-
-import logging
-
-from peewee import DatabaseProxy, DatabaseError, OperationalError
-from playhouse.pool import PooledMySQLDatabase
-from playhouse.migrate import migrate, MySQLMigrator
-
-from config import Config
-from models import Fund, Quote, DBConfig
-
-log = logging.getLogger(__name__)
-
-
-###############################################################################
-# Database initialization
-# https://docs.peewee-orm.com/en/latest/peewee/database.html#dynamically-defining-a-database
-# https://docs.peewee-orm.com/en/latest/peewee/playhouse.html#database-url
-# https://docs.peewee-orm.com/en/latest/peewee/database.html#setting-the-database-at-run-time
-###############################################################################
-class Database():
-    BATCH_SIZE = 250  # TODO: move to Config argparse
-    DB = DatabaseProxy()
-    MODELS = [Fund, Quote, DBConfig]
-    SCHEMA_VERSION = 1
-
-    def __init__(self):
-        """ Create a pooled connection to MySQL database """
-        self.args = Config.get_args()
-
-        log.info('Connecting to MySQL database on '
-                 f'{self.args.db_host}:{self.args.db_port}...')
-
-        # https://docs.peewee-orm.com/en/latest/peewee/playhouse.html#pool-apis
-        database = PooledMySQLDatabase(
-            self.args.db_name,
-            host=self.args.db_host,
-            port=self.args.db_port,
-            user=self.args.db_user,
-            password=self.args.db_pass,
-            charset='utf8mb4',
-            autoconnect=False,
-            max_connections=self.args.db_max_conn,  # use None for unlimited
-            stale_timeout=180,  # use None to disable
-            timeout=10)  # 0 blocks indefinitely
-
-        # Initialize DatabaseProxy
-        self.DB.initialize(database)
-
-        # Bind models to this database
-        self.DB.bind(self.MODELS)
-
-        try:
-            self.DB.connect()
-            self.verify_database_schema()
-            self.verify_table_encoding()
-        except OperationalError as e:
-            log.error('Unable to connect to database: %s', e)
-        except DatabaseError as e:
-            log.exception('Failed to initalize database: %s', e)
-        finally:
-            self.DB.close()
-
-    #  https://docs.peewee-orm.com/en/latest/peewee/api.html#Database.create_tables
-    def create_tables(self):
-        """ Create tables in the database (skips existing) """
-        table_names = ', '.join([m.__name__ for m in self.MODELS])
-        log.info('Creating database tables: %s', table_names)
-        self.DB.create_tables(self.MODELS, safe=True)  # safe == if not exists
-        # Create schema version key
-        DBConfig.insert_schema_version(self.SCHEMA_VERSION)
-        log.info('Database schema created.')
-
-    #  https://docs.peewee-orm.com/en/latest/peewee/api.html#Database.drop_tables
-    def drop_tables(self):
-        """ Drop all the tables in the database """
-        table_names = ', '.join([m.__name__ for m in self.MODELS])
-        log.info('Dropping database tables: %s', table_names)
-        self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=0;')
-        self.DB.drop_tables(self.MODELS, safe=True)
-        self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=1;')
-        log.info('Database schema deleted.')
-
-    # https://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
-    def migrate_database_schema(self, old_ver):
-        """ Migrate database schema """
-        log.info(f'Migrating schema v.{old_ver} to v.{self.SCHEMA_VERSION}.')
-        migrator = MySQLMigrator(self.DB)
-
-        if old_ver < 2:
-            migrate(migrator.rename_table('db_config', 'db_config'))
-
-        log.info('Schema migration complete.')
-
-    def verify_database_schema(self):
-        """ Verify if database is properly initialized """
-        if not DBConfig.table_exists():
-            self.create_tables()
-            return
-
-        DBConfig.init_lock()
-        db_ver = DBConfig.get_schema_version()
-
-        # Check if schema migration is required
-        if db_ver < self.SCHEMA_VERSION:
-            self.migrate_database_schema(db_ver)
-            DBConfig.update_schema_version(self.SCHEMA_VERSION)
-        elif db_ver > self.SCHEMA_VERSION:
-            raise RuntimeError(
-                f'Unsupported schema version: {db_ver} '
-                f'(code requires: {self.SCHEMA_VERSION})')
-
-    def verify_table_encoding(self):
-        """ Verify if table collation is valid """
-        change_tables = self.DB.execute_sql(
-            'SELECT table_name FROM information_schema.tables WHERE '
-            'table_collation != "utf8mb4_unicode_ci" '
-            f'AND table_schema = "{self.args.db_name}";')
-
-        tables = self.DB.execute_sql('SHOW tables;')
-
-        if change_tables.rowcount > 0:
-            log.info('Changing collation and charset on '
-                     f'{change_tables.rowcount} tables.')
-
-            if change_tables.rowcount == tables.rowcount:
-                log.info('Changing whole database, this might a take while.')
-
-            self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=0;')
-            for table in change_tables:
-                log.debug('Changing collation and charset on '
-                          f'table {table[0]}.')
-                self.DB.execute_sql(
-                    f'ALTER TABLE {table[0]} CONVERT TO '
-                    'CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;')
-            self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=1;')
-
-    def print_stats(self):
-        in_use = len(self.DB._in_use)
-        available = len(self.DB._connections)
-        log.info('Database connections: '
-                 f'{in_use} in use and {available} available.')
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+from hashlib import blake2b
+from timeit import default_timer as timer
+from datetime import date, datetime
+
+from peewee import DatabaseProxy, DatabaseError, OperationalError, DateField, fn
+from playhouse.migrate import migrate, MySQLMigrator, SqliteMigrator
+from playhouse.pool import PooledMySQLDatabase, PooledSqliteDatabase
+
+from config import Config
+from models import Fund, Quote, FundLatestQuote, WebPage, DBConfig
+from utils import month_start
+
+log = logging.getLogger(__name__)
+
+
+class PooledSqliteWalDatabase(PooledSqliteDatabase):
+    """ Pooled SQLite database where transactions take the write lock when they begin """
+
+    def begin(self, lock_type=None):
+        # Deferred transactions fail as busy when upgrading a read lock to write
+        super().begin(lock_type or 'IMMEDIATE')
+
+
+###############################################################################
+# Database initialization
+# https://docs.peewee-orm.com/en/latest/peewee/database.html#dynamically-defining-a-database
+# https://docs.peewee-orm.com/en/latest/peewee/playhouse.html#database-url
+# https://docs.peewee-orm.com/en/latest/peewee/database.html#setting-the-database-at-run-time
+###############################################################################
+class Database():
+    BATCH_SIZE = 250
+    DB = DatabaseProxy()
+    MODELS = [Fund, Quote, FundLatestQuote, WebPage, DBConfig]
+    SCHEMA_VERSION = 4
+
+    def __init__(self):
+        """ Create a pooled connection to MySQL or SQLite database """
+        self.args = Config.get_args()
+        self.is_mysql = self.args.db_engine == 'mysql'
+        self.timings = {}
+
+        # Connection pool is shared by all instances of this process
+        if self.DB.obj is not None:
+            return
+
+        Database.BATCH_SIZE = self.args.db_batch_size
+
+        start_t = timer()
+        if self.is_mysql:
+            database = self.mysql_database()
+        else:
+            database = self.sqlite_database()
+
+        # Initialize DatabaseProxy
+        self.DB.initialize(database)
+
+        # Bind models to this database
+        self.DB.bind(self.MODELS)
+
+        try:
+            self.timed('connect', self.DB.connect)
+            fingerprint = self.schema_fingerprint()
+            if self.timed('fingerprint', self.get_fingerprint) != fingerprint:
+                self.verify_database()
+                DBConfig.set_value('schema_fingerprint', fingerprint)
+        except OperationalError as e:
+            log.error('Unable to connect to database: %s', e)
+        except DatabaseError as e:
+            log.exception('Failed to initalize database: %s', e)
+        finally:
+            self.DB.close()
+
+        timings = ', '.join(f'{name} {elapsed * 1000:.1f} ms'
+                            for name, elapsed in self.timings.items())
+        log.debug(f'Database startup in {(timer() - start_t) * 1000:.1f} ms: {timings}.')
+
+    def timed(self, name, func):
+        """ Call function and record its elapsed time """
+        start_t = timer()
+        try:
+            return func()
+        finally:
+            self.timings[name] = timer() - start_t
+
+    def verify_database(self):
+        """ Verify schema, encoding and latest table, then run table maintenance """
+        self.timed('schema', self.verify_database_schema)
+        if self.is_mysql:
+            self.timed('encoding', self.verify_table_encoding)
+        self.timed('latest table', self.verify_latest_table)
+        self.timed('maintenance', self.maintain_quote_table)
+
+    def schema_fingerprint(self):
+        """ Hash of the models and options that database verification depends on """
+        parts = [str(self.SCHEMA_VERSION), self.args.db_engine,
+                 f'latest_table={self.args.db_latest_table}']
+        for model in self.MODELS:
+            parts.append(model._meta.table_name)
+            parts.extend(f'{field.column_name}:{field.field_type}:{field.null}:'
+                         f'{field.unique}:{field.index}'
+                         for field in model._meta.sorted_fields)
+            parts.extend(str(index) for index in model._meta.indexes)
+
+        if self.args.db_partition:
+            # Quote table maintenance is due once a day
+            parts.append(f'partition={self.args.db_partition_ahead}:{date.today()}')
+
+        return blake2b('|'.join(parts).encode(), digest_size=10).hexdigest()
+
+    def get_fingerprint(self):
+        """ Fingerprint of the last verified schema, None if not initialized """
+        try:
+            return DBConfig.get_value('schema_fingerprint')
+        except DatabaseError:
+            # Configuration table does not exist yet
+            return None
+
+    def mysql_database(self):
+        log.info('Connecting to MySQL database on '
+                 f'{self.args.db_host}:{self.args.db_port}...')
+
+        # https://docs.peewee-orm.com/en/latest/peewee/playhouse.html#pool-apis
+        return PooledMySQLDatabase(
+            self.args.db_name,
+            host=self.args.db_host,
+            port=self.args.db_port,
+            user=self.args.db_user,
+            password=self.args.db_pass,
+            charset='utf8mb4',
+            autoconnect=False,
+            max_connections=self.args.db_max_conn,  # use None for unlimited
+            stale_timeout=180,  # use None to disable
+            timeout=10)  # 0 blocks indefinitely
+
+    def sqlite_database(self):
+        filename = self.args.db_name
+        if not os.path.splitext(filename)[1]:
+            filename += '.db'
+
+        log.info(f'Opening SQLite database {filename}...')
+
+        # https://docs.peewee-orm.com/en/latest/peewee/database.html#recommended-settings
+        # WAL lets readers run alongside the writer, which only syncs on checkpoints.
+        return PooledSqliteWalDatabase(
+            filename,
+            pragmas={
+                'journal_mode': 'wal',
+                'synchronous': 'normal',
+                'cache_size': -64 * 1024,  # 64 MiB
+                'temp_store': 'memory',
+                'busy_timeout': 10000,  # wait for the writer lock (ms)
+                'foreign_keys': 1},
+            check_same_thread=False,  # pooled connections move between threads
+            autoconnect=False,
+            max_connections=self.args.db_max_conn,
+            stale_timeout=180,
+            timeout=10)
+
+    #  https://docs.peewee-orm.com/en/latest/peewee/api.html#Database.create_tables
+    def create_tables(self):
+        """ Create tables in the database (skips existing) """
+        table_names = ', '.join([m.__name__ for m in self.MODELS])
+        log.info('Creating database tables: %s', table_names)
+        self.DB.create_tables(self.MODELS, safe=True)  # safe == if not exists
+        # Create schema version key
+        DBConfig.insert_schema_version(self.SCHEMA_VERSION)
+        log.info('Database schema created.')
+
+    #  https://docs.peewee-orm.com/en/latest/peewee/api.html#Database.drop_tables
+    def drop_tables(self):
+        """ Drop all the tables in the database """
+        table_names = ', '.join([m.__name__ for m in self.MODELS])
+        log.info('Dropping database tables: %s', table_names)
+        if self.is_mysql:
+            self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=0;')
+            self.DB.drop_tables(self.MODELS, safe=True)
+            self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=1;')
+        else:
+            self.DB.pragma('foreign_keys', 0)
+            self.DB.drop_tables(self.MODELS, safe=True)
+            self.DB.pragma('foreign_keys', 1)
+        log.info('Database schema deleted.')
+
+    # https://docs.peewee-orm.com/en/latest/peewee/playhouse.html#schema-migrations
+    def migrate_database_schema(self, old_ver):
+        """ Migrate database schema """
+        log.info(f'Migrating schema v.{old_ver} to v.{self.SCHEMA_VERSION}.')
+
+        if self.is_mysql:
+            migrator = MySQLMigrator(self.DB)
+        else:
+            migrator = SqliteMigrator(self.DB)
+
+        if old_ver < 2:
+            WebPage.create_table(safe=True)
+
+        if old_ver < 3:
+            self.migrate_quote_date(migrator)
+
+        if old_ver < 4:
+            FundLatestQuote.create_table(safe=True)
+
+        log.info('Schema migration complete.')
+
+    def migrate_quote_date(self, migrator):
+        """ Add Quote.quote_date with a unique (fund_id, quote_date) index """
+        migrate(migrator.add_column('quote', 'quote_date', DateField(null=True)))
+
+        # Quotes scrapped before v3 only have the scrapping time
+        Quote.update(quote_date=fn.DATE(Quote.created)).execute()
+
+        # Keep the most recent quote of each fund per day
+        if self.is_mysql:
+            self.DB.execute_sql(
+                'DELETE q1 FROM quote q1 JOIN quote q2 '
+                'ON q1.fund_id = q2.fund_id AND q1.quote_date = q2.quote_date '
+                'AND q1.id < q2.id;')
+        else:
+            self.DB.execute_sql(
+                'DELETE FROM quote WHERE EXISTS (SELECT 1 FROM quote q2 '
+                'WHERE q2.fund_id = quote.fund_id AND q2.quote_date = quote.quote_date '
+                'AND q2.id > quote.id);')
+
+        migrate(
+            migrator.add_not_null('quote', 'quote_date'),
+            migrator.add_index('quote', ('fund_id', 'quote_date'), True))
+
+    def verify_database_schema(self):
+        """ Verify if database is properly initialized """
+        if not DBConfig.table_exists():
+            self.create_tables()
+            return
+
+        DBConfig.init_lock()
+        db_ver = DBConfig.get_schema_version()
+
+        # Check if schema migration is required
+        if db_ver < self.SCHEMA_VERSION:
+            self.migrate_database_schema(db_ver)
+            DBConfig.update_schema_version(self.SCHEMA_VERSION)
+        elif db_ver > self.SCHEMA_VERSION:
+            raise RuntimeError(
+                f'Unsupported schema version: {db_ver} '
+                f'(code requires: {self.SCHEMA_VERSION})')
+
+    def verify_latest_table(self):
+        """ Build latest quotes table when requested and not maintained yet """
+        if self.args.db_latest_table and not FundLatestQuote.is_enabled():
+            FundLatestQuote.enable()
+
+    def maintenance(self):
+        """ Periodic quote table maintenance with its own connection """
+        try:
+            with self.DB.connection_context():
+                self.maintain_quote_table()
+        except DatabaseError as e:
+            log.exception('Failed quote table maintenance: %s', e)
+
+    def maintain_quote_table(self):
+        """ Create upcoming quote partitions """
+        if self.args.db_partition and self.is_mysql:
+            self.verify_quote_partitions()
+        elif self.args.db_partition:
+            log.warning('Quote table partitioning is only supported by MySQL.')
+
+    def quote_partitions(self):
+        """ Monthly partitions of the quote table, empty if not partitioned """
+        cursor = self.DB.execute_sql(
+            'SELECT partition_name FROM information_schema.partitions '
+            f'WHERE table_schema = "{self.args.db_name}" AND table_name = "quote" '
+            'AND partition_name IS NOT NULL AND partition_name != "pmax" '
+            'ORDER BY partition_ordinal_position;')
+
+        return [row[0] for row in cursor]
+
+    @staticmethod
+    def partition_definitions(start, end):
+        """ Monthly partitions from start to end, with the catch-all partition """
+        definitions = []
+        month = month_start(start)
+        while month <= end:
+            upper = month_start(month, 1)
+            definitions.append(f"PARTITION p{month:%Y%m} VALUES LESS THAN ('{upper}')")
+            month = upper
+
+        definitions.append('PARTITION pmax VALUES LESS THAN (MAXVALUE)')
+        return ', '.join(definitions)
+
+    def verify_quote_partitions(self):
+        """ Partition quote table by month and create partitions ahead of time """
+        partitions = self.quote_partitions()
+        ahead = month_start(date.today(), self.args.db_partition_ahead)
+
+        if not partitions:
+            self.partition_quote_table(ahead)
+            return
+
+        last = datetime.strptime(partitions[-1], 'p%Y%m').date()
+        if last >= ahead:
+            return
+
+        # Split new months from the catch-all partition, it only has far future quotes
+        log.info(f'Adding quote partitions until {ahead:%Y-%m}.')
+        definitions = self.partition_definitions(month_start(last, 1), ahead)
+        self.DB.execute_sql(
+            f'ALTER TABLE quote REORGANIZE PARTITION pmax INTO ({definitions});')
+
+    def partition_quote_table(self, ahead):
+        """
+        Partition quote table by quote_date month.
+        MySQL requires the partition column in every unique key and does not
+        support foreign keys on partitioned tables.
+        """
+        log.info('Partitioning quote table by month, this might take a while.')
+
+        constraints = self.DB.execute_sql(
+            'SELECT constraint_name FROM information_schema.referential_constraints '
+            f'WHERE constraint_schema = "{self.args.db_name}" AND table_name = "quote";')
+        for constraint in constraints.fetchall():
+            self.DB.execute_sql(f'ALTER TABLE quote DROP FOREIGN KEY {constraint[0]};')
+
+        self.DB.execute_sql(
+            'ALTER TABLE quote DROP PRIMARY KEY, ADD PRIMARY KEY (id, quote_date);')
+
+        first = Quote.select(fn.MIN(Quote.quote_date)).scalar() or date.today()
+        definitions = self.partition_definitions(first, ahead)
+        self.DB.execute_sql(
+            'ALTER TABLE quote PARTITION BY RANGE COLUMNS(quote_date) '
+            f'({definitions});')
+        log.info('Quote table partitioned.')
+
+    def verify_table_encoding(self):
+        """ Verify if table collation is valid """
+        change_tables = self.DB.execute_sql(
+            'SELECT table_name FROM information_schema.tables WHERE '
+            'table_collation != "utf8mb4_unicode_ci" '
+            f'AND table_schema = "{self.args.db_name}";')
+
+        tables = self.DB.execute_sql('SHOW tables;')
+
+        if change_tables.rowcount > 0:
+            log.info('Changing collation and charset on '
+                     f'{change_tables.rowcount} tables.')
+
+            if change_tables.rowcount == tables.rowcount:
+                log.info('Changing whole database, this might a take while.')
+
+            self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=0;')
+            for table in change_tables:
+                log.debug('Changing collation and charset on '
+                          f'table {table[0]}.')
+                self.DB.execute_sql(
+                    f'ALTER TABLE {table[0]} CONVERT TO '
+                    'CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;')
+            self.DB.execute_sql('SET FOREIGN_KEY_CHECKS=1;')
+
+    def print_stats(self):
+        in_use = len(self.DB._in_use)
+        available = len(self.DB._connections)
+        log.info('Database connections: '
+                 f'{in_use} in use and {available} available.')
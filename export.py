@@ -0,0 +1,210 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+import logging
+import os
+import shutil
+from itertools import islice
+from timeit import default_timer as timer
+
+from config import Config
+from db import Database
+from models import DBConfig, Fund, Quote
+from utils import configure_logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401
+    import pyarrow.parquet  # noqa: F401
+except ImportError:
+    pa = None
+
+log = logging.getLogger()
+
+# Bank is not stored in the files, it is the partition directory
+COLUMNS = ['id', 'fund_id', 'fund', 'quote_date', 'value']
+
+
+class CsvWriter():
+    """ Gzip compressed CSV partition file """
+    EXTENSION = 'csv.gz'
+
+    def __init__(self, filename):
+        self.filename = filename
+        # Write to a temporary file, renamed when complete
+        self.file = gzip.open(f'{filename}.part', 'wt', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+        os.replace(f'{self.filename}.part', self.filename)
+
+
+class ArrowWriter():
+    """ Parquet or Arrow IPC partition file, each write is a row group/batch """
+    SCHEMA = None
+
+    def __init__(self, filename, file_format):
+        if ArrowWriter.SCHEMA is None:
+            ArrowWriter.SCHEMA = pa.schema([
+                ('id', pa.int64()),
+                ('fund_id', pa.int32()),
+                ('fund', pa.string()),
+                ('quote_date', pa.date32()),
+                ('value', pa.float64())])
+
+        self.filename = filename
+        if file_format == 'parquet':
+            self.writer = pa.parquet.ParquetWriter(
+                f'{filename}.part', self.SCHEMA, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(f'{filename}.part', self.SCHEMA)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type)
+             for column, field in zip(columns, self.SCHEMA)],
+            schema=self.SCHEMA))
+
+    def close(self):
+        self.writer.close()
+        os.replace(f'{self.filename}.part', self.filename)
+
+
+class Exporter():
+    """
+    Export quotes joined with their fund to columnar files.
+
+    Quotes are read in chunks of ascending ID and written to files
+    partitioned as "<export path>/bank=<BANK>/month=<YYYY-MM>/", so memory
+    use does not depend on the table size. The last exported ID is kept in
+    DBConfig and the next export continues after it. Values updated in place
+    by a later scrap of the same day are not exported again.
+
+    A full export is written to a new directory which then replaces the
+    export path, files of previous exports are removed.
+    """
+    EXTENSIONS = {'parquet': 'parquet', 'arrow': 'arrow', 'csv': CsvWriter.EXTENSION}
+    # Limit open partition files, each one holds a file handle and buffers
+    MAX_OPEN_FILES = 64
+
+    def __init__(self):
+        self.args = Config.get_args()
+        self.path = self.args.export_path
+        self.chunk_size = self.args.export_chunk_size
+        self.file_format = self.args.export_format
+        if self.file_format != 'csv' and pa is None:
+            log.warning('pyarrow is not installed, exporting to compressed CSV.')
+            self.file_format = 'csv'
+
+        self.writers = {}
+        self.files = []
+        self.exported = 0
+
+    def read_chunks(self, last_id):
+        """ Generate chunks of quote rows after the last exported ID """
+        query = (Quote
+                 .select(Quote.id, Fund.id, Fund.bank, Fund.name,
+                         Quote.quote_date, Quote.value)
+                 .join(Fund))
+        rows = Quote.iter_all(self.chunk_size, 'tuples', query, after=last_id)
+
+        return iter(lambda: list(islice(rows, self.chunk_size)), [])
+
+    def partition(self, rows):
+        """ Group rows by bank and month, dropping the bank column """
+        partitions = {}
+        for quote_id, fund_id, bank, name, quote_date, value in rows:
+            key = (bank or 'unknown', quote_date.strftime('%Y-%m'))
+            partitions.setdefault(key, []).append((quote_id, fund_id, name, quote_date, value))
+
+        return partitions
+
+    def get_writer(self, key, first_id):
+        writer = self.writers.pop(key, None)
+        if writer is None:
+            if len(self.writers) >= self.MAX_OPEN_FILES:
+                # Dicts keep insertion order, first writer is the least recently used
+                self.close_writer(next(iter(self.writers)))
+
+            bank, month = key
+            path = os.path.join(self.path, f'bank={bank}', f'month={month}')
+            os.makedirs(path, exist_ok=True)
+            extension = self.EXTENSIONS[self.file_format]
+            filename = os.path.join(path, f'part-{first_id}.{extension}')
+            if self.file_format == 'csv':
+                writer = CsvWriter(filename)
+            else:
+                writer = ArrowWriter(filename, self.file_format)
+
+        self.writers[key] = writer
+        return writer
+
+    def close_writer(self, key):
+        writer = self.writers.pop(key)
+        writer.close()
+        self.files.append(writer.filename)
+
+    def replace_export(self, export_path):
+        """ Swap the new full export with the previous export directory """
+        previous = f'{export_path}.previous'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(export_path):
+            os.rename(export_path, previous)
+        os.rename(self.path, export_path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+        self.files = [os.path.join(export_path, os.path.relpath(filename, self.path))
+                      for filename in self.files]
+        self.path = export_path
+
+    def run(self, full=False):
+        start_t = timer()
+        export_path = os.path.normpath(self.path)
+        if full:
+            # Left over by an interrupted full export
+            self.path = f'{export_path}.full'
+            shutil.rmtree(self.path, ignore_errors=True)
+            os.makedirs(self.path)
+
+        with Quote.database().connection_context():
+            last_id = 0 if full else int(DBConfig.get_value('export_last_id', 0))
+            log.info(f'Exporting quotes after ID {last_id} to {self.file_format} files.')
+
+            for rows in self.read_chunks(last_id):
+                for key, partition in self.partition(rows).items():
+                    self.get_writer(key, partition[0][0]).write(partition)
+
+                last_id = rows[-1][0]
+                self.exported += len(rows)
+                log.debug(f'Exported {self.exported} quotes.')
+
+            for key in list(self.writers):
+                self.close_writer(key)
+
+            if full:
+                self.replace_export(export_path)
+
+            # Only advance after all files are complete
+            if self.exported or full:
+                DBConfig.set_value('export_last_id', str(last_id))
+
+        elapsed = timer() - start_t
+        log.info(f'Exported {self.exported} quotes to {len(self.files)} files '
+                 f'in {elapsed:.2f}s.')
+        return self.exported
+
+
+if __name__ == '__main__':
+    args = Config.get_args()
+    configure_logging(log, args.verbose, args.log_path, "-fund-quotes-export")
+
+    Database()
+    Exporter().run(args.export_full)
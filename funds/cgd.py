@@ -1,74 +1,123 @@
-from datetime import datetime, timedelta
-import logging
-import re
-
-from bs4 import BeautifulSoup
-
-from models import Fund, Quote
-from db import Database
-from scrapper import Scrapper
-
-
-log = logging.getLogger(__name__)
-
-
-class CGD(Scrapper):
-    URL = ('https://www.cgd.pt/Particulares/Poupanca-Investimento/Fundos-de-Investimento'
-           '/Pages/CotacoeseRendibilidades.aspx')
-    BANK = 'CGD'
-
-    def __init__(self):
-        Scrapper.__init__(self, name=self.BANK)
-        self.db = Database()
-
-    def scrap(self):
-        content = self.make_request(self.URL)
-
-        try:
-            Fund.database().connect()
-            self.parse(content)
-        finally:
-            Fund.database().close()
-
-    def parse(self, content):
-        soup = BeautifulSoup(content, 'html.parser')
-        details = soup.find_all('div', 'detalhesFundo')
-
-        for info in details:
-            name = info.find('a', class_='nomeFundo').get_text()
-
-            fund, is_new = Fund.get_or_create(bank=self.BANK, name=name)
-
-            date = info.find('div', class_='cotacaoDiaLbl').get_text()
-            match = re.search(r'\d{2}\-\d{2}\-\d{4}', date)
-            if not match:
-                log.error(f'Unable to find a valid date in: {date}')
-                continue
-
-            date = datetime.strptime(match.group(), '%d-%m-%Y')
-            max_age = datetime.utcnow() - timedelta(hours=self.args.scrapper_frequency)
-
-            recent_quotes = Quote.select().where(
-                Quote.fund == fund,
-                Quote.created > max_age
-            ).count()
-
-            if recent_quotes > 0:
-                log.debug(f'Quote for {name} on {date} already exists.')
-                continue
-            if date < datetime.utcnow() - timedelta(days=2):
-                log.debug(f'Quote for {name} on {date} is too old.')
-                continue
-
-            quote = info.find('div', class_="cotacaoDia").get_text()
-            match = re.search(r'([\d\,]+) €', quote)
-            if match:
-                quote = float(match.group(1).replace(',', '.'))
-
-            new_quote = Quote.create(fund=fund, value=quote)
-            log.debug(f'Quote for {name} on {date}: {new_quote.value}')
-
-            prev_quote = info.find('div', class_="cotacaoDiaAnterior").get_text()
-            match = re.search(r'([\d\,]+) €', prev_quote)
-            if match:
-                prev_quote = float(match.group(1).replace(',', '.'))
+from datetime import datetime, timedelta
+import logging
+import re
+
+from bs4 import SoupStrainer
+
+from models import Fund
+from scrapper import StagedScrapper
+from utils import previous_business_day
+
+
+log = logging.getLogger(__name__)
+
+DATE_REGEX = re.compile(r'\d{2}\-\d{2}\-\d{4}')
+VALUE_REGEX = re.compile(r'([\d\,]+) €')
+
+
+class CGD(StagedScrapper):
+    URL = ('https://www.cgd.pt/Particulares/Poupanca-Investimento/Fundos-de-Investimento'
+           '/Pages/CotacoeseRendibilidades.aspx')
+    BANK = 'CGD'
+    # Quotes from the previous business day are published in the morning
+    PUBLISH_TIMES = ['08:00']
+    PARSE_ONLY = SoupStrainer('div', class_='detalhesFundo')
+
+    def __init__(self):
+        StagedScrapper.__init__(self, name=self.BANK)
+
+    def fetch(self):
+        content = self.request_url(self.URL, cache=True)
+        if content is None:
+            raise RuntimeError('Unable to download quotes page.')
+
+        return content
+
+    def parse(self, content):
+        return self.store(self.parse_quotes(content))
+
+    def parse_quotes(self, content):
+        return self.parse_content(content, self.parser, self.PARSE_ONLY)
+
+    @classmethod
+    def parse_content(cls, content, parser, parse_only=None, now=None):
+        """ Extract fund names and quotes recent at the time the page was downloaded """
+        soup = cls.make_soup(content, parser, parse_only)
+        details = soup.find_all('div', 'detalhesFundo')
+
+        names = []
+        quotes = {}
+        max_age = (now or datetime.utcnow()) - timedelta(days=2)
+        for info in details:
+            name = info.find('a', class_='nomeFundo').get_text()
+            names.append(name)
+
+            date = info.find('div', class_='cotacaoDiaLbl').get_text()
+            match = DATE_REGEX.search(date)
+            if not match:
+                log.error(f'Unable to find a valid date in: {date}')
+                continue
+
+            date = datetime.strptime(match.group(), '%d-%m-%Y')
+
+            value = cls.parse_value(info, 'cotacaoDia')
+            if value is None:
+                continue
+
+            if date < max_age:
+                log.debug(f'Quote for {name} on {date} is too old.')
+                continue
+
+            prev_value = cls.parse_value(info, 'cotacaoDiaAnterior')
+            quotes[name] = (date, value, prev_value)
+
+        return names, quotes
+
+    @staticmethod
+    def parse_value(info, class_):
+        """ Parse quote value from a div, e.g. "12,3456 €" """
+        div = info.find('div', class_=class_)
+        if div is None:
+            return None
+
+        quote = div.get_text()
+        match = VALUE_REGEX.search(quote)
+        if not match:
+            log.error(f'Unable to find a valid quote in: {quote}')
+            return None
+
+        return float(match.group(1).replace(',', '.'))
+
+    def store(self, parsed):
+        names, quotes = parsed
+        return self.store_quotes(names, quotes)
+
+    def store_quotes(self, names, quotes):
+        """ Resolve funds and upsert quotes with a constant number of queries """
+        funds = Fund.get_or_create_many(self.BANK, names)
+
+        rows = []
+        history = []
+        for name, (date, value, prev_value) in quotes.items():
+            fund = funds[name]
+            rows.append({'fund': fund.id, 'quote_date': date.date(), 'value': value})
+            log.debug(f'Quote for {name} on {date}: {value}')
+
+            if prev_value is not None:
+                history.append({
+                    'fund': fund.id,
+                    'quote_date': previous_business_day(date.date()),
+                    'value': prev_value
+                })
+
+        count = self.save_quotes(rows)
+        if self.args.backfill:
+            history_count = self.store_history(history)
+            if count is not None:
+                count += history_count
+
+        return count
+
+    def store_history(self, rows):
+        """ Store previous business day quotes missing from the database """
+        return self.save_quotes(rows, history=True)
@@ -2,14 +2,17 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import random
 
 from peewee import (
     fn, JOIN, Case, OperationalError, IntegrityError,
-    Model, ModelSelect, ModelUpdate, ModelDelete, AutoField,
-    ForeignKeyField, BigAutoField, DateTimeField, CharField,
-    IntegerField, BigIntegerField, SmallIntegerField, FloatField)
+    Model, ModelSelect, MySQLDatabase, ModelUpdate, ModelDelete, AutoField,
+    ForeignKeyField, BigAutoField, DateField, DateTimeField, CharField,
+    IntegerField, BigIntegerField, SmallIntegerField, FloatField, chunked)
 
 from datetime import datetime, timedelta
+from hashlib import blake2b
+from operator import attrgetter, itemgetter
 
 log = logging.getLogger(__name__)
 
@@ -52,6 +55,22 @@ class IntEnumField(SmallIntegerField):
         return self.choices(value)
 
 
+def random_keys(low, high, size, exclude):
+    """ Distinct random integers between low and high not in exclude """
+    if high - low + 1 - len(exclude) <= size * 2:
+        # Few keys left, draw from the remaining ones
+        return set(random.sample(
+            [key for key in range(low, high + 1) if key not in exclude], size))
+
+    keys = set()
+    while len(keys) < size:
+        key = random.randint(low, high)
+        if key not in exclude:
+            keys.add(key)
+
+    return keys
+
+
 ###############################################################################
 # Database models
 # https://docs.peewee-orm.com/en/latest/peewee/models.html#model-options-and-table-metadata
@@ -60,17 +79,125 @@ class IntEnumField(SmallIntegerField):
 # Note: field attribute "default" is implemented purely in Python and "choices" are not validated.
 ###############################################################################
 class BaseModel(Model):
+    # Random key probing limits of get_random
+    SAMPLE_ROUNDS = 8
+    SAMPLE_MAX_PROBES = 10000
+
     @classmethod
     def database(cls):
         return cls._meta.database
 
+    @classmethod
+    def conflict_target(cls, *fields):
+        """ MySQL resolves conflicts on any unique key, others need the key fields """
+        if isinstance(cls.database(), MySQLDatabase):
+            return None
+        return fields
+
     @classmethod
     def get_all(cls):
         return [m for m in cls.select().dicts()]
 
     @classmethod
-    def get_random(cls, limit=1):
-        return cls.select().order_by(fn.Rand()).limit(limit)
+    def iter_all(cls, chunk_size=1000, row_type='dicts', query=None, after=None):
+        """
+        Generate all rows in primary key order, reading one chunk per query.
+        Chunks are selected after the last key seen (keyset pagination) and
+        iterated without peewee's result cache, so memory stays flat.
+        Rows can be 'dicts', 'tuples', 'namedtuples' or 'objects'.
+        """
+        pk = cls._meta.primary_key
+        if query is None:
+            query = cls.select()
+
+        if not pk:
+            yield from getattr(query, row_type)().iterator()
+            return
+
+        if row_type == 'tuples':
+            # Position of the primary key in the selected columns
+            index = next(i for i, column in enumerate(query._returning) if column is pk)
+            get_key = itemgetter(index)
+        elif row_type == 'dicts':
+            get_key = itemgetter(pk.name)
+        else:
+            get_key = attrgetter(pk.name)
+
+        while True:
+            chunk = query
+            if after is not None:
+                chunk = chunk.where(pk > after)
+            chunk = getattr(chunk.order_by(pk).limit(chunk_size), row_type)()
+
+            count = 0
+            for row in chunk.iterator():
+                count += 1
+                yield row
+
+            if count < chunk_size:
+                break
+            after = get_key(row)
+
+    @classmethod
+    def get_random(cls, limit=1, query=None):
+        """
+        Uniform random sample of rows, probing random primary key values.
+        Each round selects random keys between the lowest and highest key,
+        sized by the ratio of keys found so far, with an index lookup.
+        Tables without an integer primary key use reservoir sampling.
+        """
+        pk = cls._meta.primary_key
+        if query is None:
+            query = cls.select()
+
+        if not isinstance(pk, IntegerField):
+            return cls.sample_stream(limit, query)
+
+        # Separate queries, SQLite only resolves a single MIN/MAX from the index
+        low = cls.select(fn.MIN(pk)).scalar()
+        high = cls.select(fn.MAX(pk)).scalar()
+        if low is None or limit <= 0:
+            return []
+
+        span = high - low + 1
+        probed = set()
+        found = {}
+        for _ in range(cls.SAMPLE_ROUNDS):
+            missing = limit - len(found)
+            if missing <= 0 or len(probed) >= span:
+                break
+
+            # Expected hits per probed key, assume a dense key in the first round
+            density = len(found) / len(probed) if probed and found else 1.0
+            size = min(int(missing / density * 1.2) + 10, cls.SAMPLE_MAX_PROBES)
+            size = min(size, span - len(probed))
+
+            keys = random_keys(low, high, size, probed)
+            probed.update(keys)
+
+            for row in query.where(pk.in_(list(keys))):
+                found[getattr(row, pk.name)] = row
+        else:
+            if len(found) < limit:
+                # Sparse keys or a selective query
+                return cls.sample_stream(limit, query)
+
+        rows = list(found.values())
+        return random.sample(rows, limit) if len(rows) > limit else rows
+
+    @classmethod
+    def sample_stream(cls, limit=1, query=None):
+        """ Uniform random sample of rows by reservoir sampling over a streamed scan """
+        sample = []
+        for count, row in enumerate(cls.iter_all(row_type='objects', query=query)):
+            if count < limit:
+                sample.append(row)
+            else:
+                index = random.randint(0, count)
+                if index < limit:
+                    sample[index] = row
+
+        return sample
 
 
 class Fund(BaseModel):
@@ -81,13 +208,207 @@ class Fund(BaseModel):
     created = DateTimeField(index=True, default=datetime.utcnow)
     modified = DateTimeField(index=True, default=datetime.utcnow)
 
+    @staticmethod
+    def get_or_create_many(bank, names) -> dict:
+        """ Resolve fund names from a bank, creating the missing ones in bulk """
+        names = set(names)
+        if not names:
+            return {}
+
+        query = Fund.select().where((Fund.bank == bank) & (Fund.name.in_(names)))
+        funds = {fund.name: fund for fund in query}
+
+        missing = names.difference(funds)
+        if missing:
+            rows = [{'bank': bank, 'name': name} for name in missing]
+            Fund.insert_many(rows).execute()
+
+            # MySQL does not return the IDs of a multi-row insert
+            query = Fund.select().where((Fund.bank == bank) & (Fund.name.in_(missing)))
+            funds.update({fund.name: fund for fund in query})
+
+        return funds
+
 
 class Quote(BaseModel):
     id = BigAutoField()
     fund = ForeignKeyField(Fund, backref='quotes', on_delete='CASCADE')
+    quote_date = DateField(null=False)
     value = FloatField(null=False)
     created = DateTimeField(index=True, default=datetime.utcnow)
 
+    class Meta:
+        indexes = (
+            (('fund', 'quote_date'), True),  # unique
+        )
+
+    @staticmethod
+    def upsert_batch(rows, batch_size) -> int:
+        """ Insert quotes or update their value if fund already has a quote that day """
+        with Quote.database().atomic():
+            for batch in chunked(rows, batch_size):
+                (Quote
+                 .insert_many(batch)
+                 .on_conflict(
+                     conflict_target=Quote.conflict_target(Quote.fund, Quote.quote_date),
+                     preserve=[Quote.value])
+                 .execute())
+
+            if FundLatestQuote.is_enabled():
+                FundLatestQuote.refresh({row['fund'] for row in rows})
+
+        return len(rows)
+
+    @staticmethod
+    def insert_history(rows, batch_size) -> int:
+        """ Insert historical quotes, skipping days a fund already has a quote """
+        count = 0
+        with Quote.database().atomic():
+            for batch in chunked(rows, batch_size):
+                count += (Quote
+                          .insert_many(batch)
+                          .on_conflict_ignore()
+                          .as_rowcount()
+                          .execute())
+
+            if count and FundLatestQuote.is_enabled():
+                FundLatestQuote.refresh({row['fund'] for row in rows})
+
+        return count
+
+    @staticmethod
+    def query_latest_per_fund(fund_ids=None):
+        """
+        Greatest quote_date per fund, joined back to get the quote.
+        The grouped subquery is resolved with the (fund_id, quote_date) index.
+        """
+        latest = (Quote
+                  .select(Quote.fund, fn.MAX(Quote.quote_date).alias('max_date'))
+                  .group_by(Quote.fund))
+        if fund_ids is not None:
+            latest = latest.where(Quote.fund.in_(fund_ids))
+        latest = latest.alias('latest')
+
+        query = (Quote
+                 .select(Quote.id, Quote.fund, Quote.quote_date, Quote.value)
+                 .join(latest, on=((Quote.fund == latest.c.fund_id) &
+                                   (Quote.quote_date == latest.c.max_date))))
+        if fund_ids is not None:
+            query = query.where(Quote.fund.in_(fund_ids))
+
+        return query
+
+    @staticmethod
+    def latest_per_fund(fund_ids=None):
+        """ Latest quote of each fund: id, fund, quote_date and value """
+        if not FundLatestQuote.is_enabled():
+            return Quote.query_latest_per_fund(fund_ids).order_by(Quote.fund)
+
+        query = FundLatestQuote.select(
+            FundLatestQuote.quote_id.alias('id'),
+            FundLatestQuote.fund,
+            FundLatestQuote.quote_date,
+            FundLatestQuote.value)
+        if fund_ids is not None:
+            query = query.where(FundLatestQuote.fund.in_(fund_ids))
+
+        return query.order_by(FundLatestQuote.fund)
+
+
+class FundLatestQuote(BaseModel):
+    """
+    Latest quote of each fund, maintained in the quote insert transactions.
+
+    Once built the table is kept updated by every process writing quotes,
+    whatever their options, so it never goes stale.
+    """
+    fund = ForeignKeyField(Fund, primary_key=True, on_delete='CASCADE')
+    # Not a foreign key, quote table can be partitioned
+    quote_id = BigIntegerField(null=False)
+    quote_date = DateField(null=False)
+    value = FloatField(null=False)
+
+    class Meta:
+        table_name = 'fund_latest_quote'
+
+    @staticmethod
+    def is_enabled():
+        """ Table was built and is maintained, checked on each use """
+        return DBConfig.get_value('latest_table') == 'on'
+
+    @staticmethod
+    def enable():
+        """ Build the table and have all processes maintain it from now on """
+        with FundLatestQuote.database().atomic():
+            DBConfig.set_value('latest_table', 'on')
+            FundLatestQuote.rebuild()
+
+    @staticmethod
+    def refresh(fund_ids):
+        """ Update latest quote of the given funds """
+        query = (FundLatestQuote
+                 .insert_from(
+                     Quote.query_latest_per_fund(fund_ids),
+                     [FundLatestQuote.quote_id, FundLatestQuote.fund,
+                      FundLatestQuote.quote_date, FundLatestQuote.value])
+                 .on_conflict(
+                     conflict_target=FundLatestQuote.conflict_target(FundLatestQuote.fund),
+                     preserve=[FundLatestQuote.quote_id, FundLatestQuote.quote_date,
+                               FundLatestQuote.value]))
+        query.execute()
+
+    @staticmethod
+    def rebuild():
+        """ Recreate the latest quote of all funds """
+        log.info('Rebuilding latest quote of each fund.')
+        with FundLatestQuote.database().atomic():
+            FundLatestQuote.delete().execute()
+            FundLatestQuote.insert_from(
+                Quote.query_latest_per_fund(),
+                [FundLatestQuote.quote_id, FundLatestQuote.fund,
+                 FundLatestQuote.quote_date, FundLatestQuote.value]).execute()
+
+
+class WebPage(BaseModel):
+    """ HTTP cache validators of scrapped web pages """
+    url_hash = Utf8mb4CharField(null=False, max_length=40, unique=True)
+    url = Utf8mb4CharField(null=False, max_length=2000)
+    etag = Utf8mb4CharField(null=True, max_length=191)
+    last_modified = Utf8mb4CharField(null=True, max_length=64)
+    content_hash = Utf8mb4CharField(null=True, max_length=40)
+    modified = DateTimeField(index=True, default=datetime.utcnow)
+
+    class Meta:
+        table_name = 'web_page'
+
+    @staticmethod
+    def hash(content) -> str:
+        """ Digest used for URLs and page contents """
+        if isinstance(content, str):
+            content = content.encode()
+        return blake2b(content, digest_size=20).hexdigest()
+
+    @staticmethod
+    def get_page(url):
+        """ Get stored validators for URL, None if never scrapped """
+        return WebPage.get_or_none(WebPage.url_hash == WebPage.hash(url))
+
+    @staticmethod
+    def save_page(url, etag, last_modified, content_hash):
+        """ Insert or update validators for URL """
+        url_hash = WebPage.hash(url)
+        values = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_hash': content_hash,
+            'modified': datetime.utcnow()
+        }
+
+        with WebPage.database().atomic():
+            query = WebPage.update(**values).where(WebPage.url_hash == url_hash)
+            if query.execute() == 0:
+                WebPage.insert(url_hash=url_hash, url=url, **values).execute()
+
 
 class DBConfig(BaseModel):
     """ Database versioning model """
@@ -122,6 +443,32 @@ class DBConfig(BaseModel):
                      .where(DBConfig.key == 'schema_version'))
             query.execute()
 
+    @staticmethod
+    def get_value(key, default=None):
+        """ Get a configuration value """
+        row = DBConfig.get_or_none(DBConfig.key == key)
+        return row.val if row else default
+
+    @staticmethod
+    def set_value(key, val):
+        """ Insert or update a configuration value """
+        with DBConfig.database().atomic():
+            query = (DBConfig
+                     .update(val=val, modified=datetime.utcnow())
+                     .where(DBConfig.key == key))
+            if query.execute() == 0:
+                DBConfig.insert(key=key, val=val).execute()
+
+    @staticmethod
+    def get_quotes_version():
+        """ Get the marker of the last committed quotes update """
+        return DBConfig.get_value('quotes_version')
+
+    @staticmethod
+    def update_quotes_version():
+        """ Signal readers (e.g. API caches) that quotes have changed """
+        DBConfig.set_value('quotes_version', datetime.utcnow().isoformat())
+
     @staticmethod
     def init_lock():
         """ Initialize database lock """
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from threading import Thread
+from timeit import default_timer as timer
+
+from config import Config
+from pipeline import Pipeline
+from registry import Registry
+from sink import QuoteSink
+
+log = logging.getLogger(__name__)
+
+
+class Orchestrator():
+    """ Run all bank scrappers concurrently in a bounded worker pool """
+
+    def __init__(self, interrupt):
+        self.args = Config.get_args()
+        self.interrupt = interrupt
+        self.scrappers = []
+
+        for cls in self.discover():
+            try:
+                scrapper = cls()
+                scrapper.interrupt = interrupt
+                self.scrappers.append(scrapper)
+            except Exception as e:
+                log.exception(f'Failed to initialize {cls.__name__} scrapper: {e}')
+
+        # Each worker holds one database connection while storing quotes,
+        # keep one connection available for the main thread.
+        connections = self.args.db_max_conn - 1
+        if QuoteSink.get_sink():
+            connections -= 1
+        async_count = len([s for s in self.scrappers if s.is_async()])
+        staged_count = len([s for s in self.scrappers if s.is_staged() and not s.is_async()])
+        sync_count = len(self.scrappers) - async_count - staged_count
+
+        # Asynchronous scrappers share one event loop running in its own
+        # thread, kept alive between runs along with their HTTP sessions.
+        self.loop = None
+        if async_count:
+            loop_workers = max(1, connections // 2)
+            connections -= loop_workers
+
+            self.loop = asyncio.new_event_loop()
+            self.loop.set_default_executor(ThreadPoolExecutor(
+                max_workers=loop_workers, thread_name_prefix='async-db'))
+            Thread(target=self.loop.run_forever, name='event-loop', daemon=True).start()
+
+        # Staged scrappers run in the pipeline, its writer holds one connection
+        self.pipeline = None
+        if staged_count:
+            connections = max(1, connections - 1)
+
+        total = sync_count + staged_count
+        workers = max(1, min(total, connections))
+        self.fetch_workers = max(1, workers * staged_count // total) if staged_count else 0
+        self.max_workers = max(1, workers - self.fetch_workers)
+
+        if staged_count:
+            self.pipeline = Pipeline(
+                self.fetch_workers,
+                self.args.scrapper_parse_workers,
+                self.args.scrapper_queue_size)
+
+    def discover(self):
+        """ Import the scrappers selected with --banks, all of them by default """
+        start_t = timer()
+        classes = []
+        for info in Registry.select(self.args.banks):
+            try:
+                classes.append(Registry.load(info))
+            except Exception as e:
+                log.exception(f'Failed to import {info.module}: {e}')
+
+        log.debug('Loaded scrappers %s in %.1f ms.', ', '.join(c.__name__ for c in classes),
+                  (timer() - start_t) * 1000)
+        return classes
+
+    def run(self, scrappers=None):
+        """ Run one scrapping cycle and collect per-scrapper results """
+        scrappers = scrappers or self.scrappers
+        if not scrappers:
+            log.warning('No scrappers available.')
+            return []
+
+        log.info(f'Running {len(scrappers)} scrappers with {self.max_workers} '
+                 f'workers and {self.fetch_workers} pipeline fetchers.')
+        start_t = timer()
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix='scrapper')
+        pending = set()
+        for scrapper in scrappers:
+            if scrapper.is_async():
+                future = asyncio.run_coroutine_threadsafe(scrapper.run_async(), self.loop)
+            elif self.pipeline and scrapper.is_staged():
+                future = self.pipeline.submit(scrapper)
+            else:
+                future = executor.submit(scrapper.run)
+            pending.add(future)
+
+        try:
+            while pending:
+                if self.interrupt.is_set():
+                    log.info('Cancelling pending scrappers.')
+                    for future in pending:
+                        future.cancel()
+                    break
+
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+        finally:
+            executor.shutdown(wait=True)
+
+        results = [scrapper.get_result() for scrapper in scrappers]
+        elapsed = timer() - start_t
+
+        for result in results:
+            log.info('{name}: {status} with result {result} in {elapsed:.3f}s, '
+                     '{connection_reuse:.0%} connections reused.'.format(**result))
+
+        # Imported with the scrappers, along with the HTTP clients
+        from retry import RetryPolicy
+        stats = RetryPolicy.get_policy().get_stats()
+        log.info('HTTP requests: {attempts} attempts, {failures} failures, '
+                 '{retries} retries, {exhausted} given up, {rejected} rejected by '
+                 'open circuits {open_circuits}.'.format(**stats))
+        log.info(f'Scrapping cycle took {elapsed:.3f}s.')
+        return results
+
+    def close(self):
+        """ Stop the pipeline, close asynchronous scrapper sessions and the event loop """
+        if self.pipeline:
+            self.pipeline.close()
+            self.pipeline = None
+
+        if self.loop is None:
+            return
+
+        async def close_sessions():
+            await asyncio.gather(*(s.close_session() for s in self.scrappers if s.is_async()))
+
+        asyncio.run_coroutine_threadsafe(close_sessions(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop = None
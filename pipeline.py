@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from threading import Thread
+
+from models import WebPage
+
+log = logging.getLogger(__name__)
+
+
+def init_parser(log_queue, level):
+    """ Send log records of a parser process to the process that started it """
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(log_queue)]
+    root.setLevel(level)
+
+
+class LogForwarder(logging.Handler):
+    """ Handle records of other processes with the loggers of this process """
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+class ParserPool(ProcessPoolExecutor):
+    """
+    Process pool for CPU bound parsing, escaping the GIL. Workers are spawned,
+    they do not inherit locks held by threads of this process, and their log
+    records are handled here like the records of this process.
+    """
+
+    def __init__(self, max_workers):
+        context = multiprocessing.get_context('spawn')
+        self.log_queue = context.Queue()
+        self.listener = QueueListener(self.log_queue, LogForwarder())
+        self.listener.start()
+
+        super().__init__(max_workers=max_workers, mp_context=context,
+                         initializer=init_parser,
+                         initargs=(self.log_queue, logging.getLogger().getEffectiveLevel()))
+
+    def shutdown(self, wait=True, **kwargs):
+        super().shutdown(wait=wait, **kwargs)
+        self.listener.stop()
+
+
+class Pipeline():
+    """
+    Staged scrapping: fetcher threads download pages, a process pool parses
+    them and a single writer thread stores the results.
+
+    Parsed pages wait for the writer in a bounded queue, fetchers block when
+    it is full so downloads do not outpace the database.
+    """
+
+    def __init__(self, fetch_workers, parse_workers, queue_size):
+        self.fetchers = ThreadPoolExecutor(
+            max_workers=fetch_workers, thread_name_prefix='fetch')
+
+        self.parsers = None
+        if parse_workers > 0:
+            self.parsers = ParserPool(parse_workers)
+
+        self.queue = Queue(maxsize=queue_size)
+        self.writer = Thread(target=self.write, name='writer', daemon=True)
+        self.writer.start()
+
+    def submit(self, scrapper):
+        """ Run scrapper through the pipeline, future result is set once stored """
+        future = Future()
+        self.fetchers.submit(self.fetch, scrapper, future)
+        return future
+
+    def fetch(self, scrapper, future):
+        if not future.set_running_or_notify_cancel():
+            return
+
+        scrapper.begin_run()
+        try:
+            # Page validators of conditional requests are read from the database
+            with WebPage.database().connection_context():
+                content = scrapper.fetch()
+
+            parse_args = (content, scrapper.parser, scrapper.PARSE_ONLY)
+            parsed = self.parse(scrapper, parse_args)
+
+            # Blocks while the writer is behind
+            self.queue.put((scrapper, parse_args, parsed, future))
+
+        except Exception as e:
+            scrapper.fail_run(e)
+            future.set_result(scrapper.get_result())
+
+    def write(self):
+        """ Store parsed pages one at a time, in the order they were fetched """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            scrapper, parse_args, parsed, future = item
+            try:
+                content = self.parse_result(scrapper, parse_args, parsed)
+                with WebPage.database().connection_context():
+                    result = scrapper.store(content)
+                    scrapper.finish_run(result)
+            except Exception as e:
+                scrapper.fail_run(e)
+
+            future.set_result(scrapper.get_result())
+
+    def parse(self, scrapper, parse_args):
+        """ Submit content to the parser processes, or parse it in this thread """
+        parsers = self.parsers
+        if parsers:
+            try:
+                return parsers.submit(type(scrapper).parse_content, *parse_args)
+            except BrokenProcessPool:
+                self.parser_failed(parsers)
+
+        parsed = Future()
+        parsed.set_result(scrapper.parse_content(*parse_args))
+        return parsed
+
+    def parse_result(self, scrapper, parse_args, parsed):
+        try:
+            return parsed.result()
+        except BrokenProcessPool:
+            self.parser_failed(self.parsers)
+            return scrapper.parse_content(*parse_args)
+
+    def parser_failed(self, parsers):
+        """ A parser process died, e.g. killed by the OOM killer """
+        if parsers is not None and parsers is self.parsers:
+            log.warning('Parser process pool is broken, parsing in scrapper threads.')
+            self.parsers = None
+            parsers.shutdown(wait=False)
+
+    def close(self):
+        """ Finish queued pages and stop workers """
+        self.fetchers.shutdown(wait=True)
+        self.queue.put(None)
+        self.writer.join()
+
+        if self.parsers:
+            self.parsers.shutdown(wait=True)
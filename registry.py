@@ -0,0 +1,152 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import ast
+import importlib
+import inspect
+import logging
+import os
+import pkgutil
+
+log = logging.getLogger(__name__)
+
+CWD = os.path.dirname(os.path.realpath(__file__))
+
+
+class ScrapperInfo():
+    """ Bank scrapper declared in a funds module, before it is imported """
+
+    def __init__(self, name, module, class_name, url=None, frequency=None,
+                 publish_times=(), parser=None):
+        self.name = name
+        self.module = module
+        self.class_name = class_name
+        self.url = url
+        self.frequency = frequency
+        self.publish_times = publish_times
+        self.parser = parser
+
+    def __repr__(self):
+        return f'<ScrapperInfo {self.name}: {self.module}.{self.class_name}>'
+
+
+class Registry():
+    """
+    Scrappers of the funds package.
+
+    Modules are scanned as source code without importing them. Classes
+    declaring a BANK name are the scrappers, their URL, schedule and parser
+    are read from literal class attributes, including the ones inherited
+    from other classes of the funds package. Only the scrappers selected
+    to run are imported.
+    """
+    FUNDS_PATH = os.path.join(CWD, 'funds')
+    FUNDS_PACKAGE = 'funds'
+    # Class attributes read by the scan
+    ATTRIBUTES = ('BANK', 'URL', 'FREQUENCY', 'PUBLISH_TIMES', 'PARSER')
+
+    @classmethod
+    def scan(cls):
+        """ Scrapper declarations of all funds modules by name """
+        classes = {}
+        for module_info in pkgutil.iter_modules([cls.FUNDS_PATH]):
+            module_name = f'{cls.FUNDS_PACKAGE}.{module_info.name}'
+            filename = os.path.join(cls.FUNDS_PATH, f'{module_info.name}.py')
+            try:
+                with open(filename, 'r', encoding='utf-8') as f:
+                    tree = ast.parse(f.read(), filename)
+            except (OSError, SyntaxError) as e:
+                log.error(f'Failed to read {module_name}: {e}')
+                continue
+
+            for class_name, bases, attributes in cls.read_module(tree):
+                classes[(module_name, class_name)] = (bases, attributes)
+
+        scrappers = {}
+        for (module_name, class_name), (bases, attributes) in classes.items():
+            # Subclasses of a scrapper are other scrappers only with their own BANK
+            if 'BANK' not in attributes:
+                continue
+
+            attributes = cls.resolve(classes, module_name, class_name)
+            scrappers[attributes['BANK']] = ScrapperInfo(
+                name=attributes['BANK'],
+                module=module_name,
+                class_name=class_name,
+                url=attributes.get('URL'),
+                frequency=attributes.get('FREQUENCY'),
+                publish_times=attributes.get('PUBLISH_TIMES', ()),
+                parser=attributes.get('PARSER'))
+
+        return scrappers
+
+    @classmethod
+    def read_module(cls, tree):
+        """ Classes of a module with their base names and literal attributes """
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+
+            bases = [getattr(base, 'id', getattr(base, 'attr', '')) for base in node.bases]
+            attributes = {}
+            for statement in node.body:
+                if (isinstance(statement, ast.Assign) and len(statement.targets) == 1 and
+                        isinstance(statement.targets[0], ast.Name) and
+                        statement.targets[0].id in cls.ATTRIBUTES):
+                    try:
+                        value = ast.literal_eval(statement.value)
+                    except ValueError:
+                        log.warning(f'{node.name}.{statement.targets[0].id} is not a literal.')
+                        continue
+                    attributes[statement.targets[0].id] = value
+
+            yield node.name, bases, attributes
+
+    @classmethod
+    def resolve(cls, classes, module_name, class_name, seen=()):
+        """ Attributes of a class, inherited from its bases in the funds package """
+        key = (module_name, class_name)
+        bases, attributes = classes[key]
+
+        resolved = {}
+        # First bases take precedence, like in the method resolution order
+        for base in reversed(bases):
+            base_key = (module_name, base)
+            if base_key not in classes:
+                base_key = next((k for k in classes if k[1] == base), None)
+            if base_key is not None and base_key not in seen:
+                resolved.update(cls.resolve(classes, *base_key, seen + (key,)))
+
+        resolved.update(attributes)
+        return resolved
+
+    @classmethod
+    def select(cls, banks=None):
+        """ Scrappers with the given names (case insensitive), all if none given """
+        scrappers = cls.scan()
+        if not banks:
+            return list(scrappers.values())
+
+        names = {name.upper(): name for name in scrappers}
+        selected = []
+        for bank in banks:
+            name = names.get(bank.upper())
+            if name is None:
+                log.error(f'Unknown bank: {bank}. Available: {", ".join(sorted(scrappers))}.')
+                continue
+            selected.append(scrappers[name])
+
+        return selected
+
+    @staticmethod
+    def load(info):
+        """ Import the module of a scrapper and return its class """
+        # Imported here, the registry is read before any scrapper stack is loaded
+        from scrapper import Scrapper
+
+        module = importlib.import_module(info.module)
+        scrapper_class = getattr(module, info.class_name)
+        if not issubclass(scrapper_class, Scrapper) or inspect.isabstract(scrapper_class):
+            raise TypeError(f'{info.module}.{info.class_name} is not a concrete scrapper.')
+
+        return scrapper_class
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+from concurrent.futures import Future
+from threading import Event
+from timeit import default_timer as timer
+
+from archive import PageArchive
+from config import Config
+from models import WebPage
+from pipeline import ParserPool
+from registry import Registry
+
+log = logging.getLogger(__name__)
+
+
+def parse_page(scrapper_class, content, parser, parse_only, now):
+    """ Parse archived content as it was parsed when downloaded """
+    return scrapper_class.parse_content(content, parser, parse_only, now=now)
+
+
+class Replay():
+    """
+    Parse web pages recorded with --archive-path again, without network.
+
+    Archived pages of each bank are parsed by a process pool and stored in
+    the order they were downloaded, so quotes of the latest page prevail.
+    Pages downloaded again unchanged are skipped. Only scrappers
+    implementing the fetch, parse and store stages can be replayed.
+    """
+
+    def __init__(self, path, interrupt=None):
+        self.args = Config.get_args()
+        self.archive = PageArchive(path)
+        self.interrupt = interrupt or Event()
+        self.dry_run = self.args.replay_dry_run
+        self.parse_workers = self.args.scrapper_parse_workers
+        self.pages = 0
+        self.failed = 0
+        self.size = 0
+        self.stored = 0
+        self.queued = 0
+
+    @staticmethod
+    def unique_entries(entries):
+        """
+        Downloads that changed the content of their page. Like live runs, a
+        page downloaded again unchanged is skipped, but a page returning to
+        a previous content is parsed again so it prevails over the one before.
+        """
+        last_hash = {}
+        unique = []
+        for entry in entries:
+            if last_hash.get(entry['url']) != entry['hash']:
+                last_hash[entry['url']] = entry['hash']
+                unique.append(entry)
+
+        return unique
+
+    def run(self):
+        start_t = timer()
+        parsers = None
+        if self.parse_workers > 0:
+            parsers = ParserPool(self.parse_workers)
+
+        try:
+            for info in Registry.select(self.args.banks):
+                if self.interrupt.is_set():
+                    break
+                self.replay_bank(info, parsers)
+        finally:
+            if parsers:
+                parsers.shutdown(wait=True)
+
+        elapsed = timer() - start_t
+        log.info(f'Replayed {self.pages} pages ({self.size / 1024:.0f} KiB) in '
+                 f'{elapsed:.2f}s ({self.pages / max(elapsed, 1e-9):.1f} pages/s), '
+                 f'{self.failed} failed, {self.stored} quotes stored, '
+                 f'quotes of {self.queued} pages queued for writing.')
+        return self.stored
+
+    def replay_bank(self, info, parsers):
+        entries = self.unique_entries(self.archive.entries(info.name))
+        if not entries:
+            log.debug(f'No archived pages of {info.name}.')
+            return
+
+        try:
+            scrapper = Registry.load(info)()
+        except Exception as e:
+            log.exception(f'Failed to initialize {info.name} scrapper: {e}')
+            return
+
+        if not scrapper.is_staged():
+            log.warning(f'{info.name} scrapper has no parse stage, it cannot be replayed.')
+            return
+
+        log.info(f'Replaying {len(entries)} archived pages of {info.name}.')
+        # Read a few pages ahead of the parsers, not the whole archive
+        batch_size = max(1, self.parse_workers) * 4
+        for start in range(0, len(entries), batch_size):
+            if self.interrupt.is_set():
+                break
+
+            batch = entries[start:start + batch_size]
+            futures = [self.parse(parsers, scrapper, entry) for entry in batch]
+            for entry, future in zip(batch, futures):
+                self.store(scrapper, entry, future)
+
+    def store(self, scrapper, entry, parsed):
+        """ Store a parsed page, unless it is a dry run """
+        try:
+            parsed = parsed.result()
+        except Exception as e:
+            self.failed += 1
+            log.error(f'Failed to replay {entry["url"]} archived on {entry["time"]}: {e}')
+            return
+
+        self.pages += 1
+        if not self.dry_run:
+            with WebPage.database().connection_context():
+                stored = scrapper.store(parsed)
+
+            # Quotes written later by the sink are not counted
+            if stored is None:
+                self.queued += 1
+            else:
+                self.stored += stored
+
+    def parse(self, parsers, scrapper, entry):
+        """ Submit archived content to the parser processes, or parse it in this thread """
+        parsed = Future()
+        try:
+            content = self.archive.read(scrapper.name, entry)
+            self.size += len(content)
+
+            parse_args = (type(scrapper), content, scrapper.parser, scrapper.PARSE_ONLY,
+                          entry['time'])
+            if parsers:
+                return parsers.submit(parse_page, *parse_args)
+
+            parsed.set_result(parse_page(*parse_args))
+        except Exception as e:
+            parsed.set_exception(e)
+        return parsed
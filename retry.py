@@ -0,0 +1,248 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from threading import Lock
+from timeit import default_timer as timer
+from urllib.parse import urlparse
+
+from requests.exceptions import (ConnectionError, InvalidSchema, InvalidURL,
+                                 MissingSchema, Timeout)
+
+from config import Config
+
+try:
+    from aiohttp import ClientConnectionError
+    from aiohttp import InvalidURL as ClientInvalidURL
+except ImportError:
+    ClientConnectionError = ConnectionError
+    ClientInvalidURL = InvalidURL
+
+log = logging.getLogger(__name__)
+
+
+class CircuitOpen(Exception):
+    """ Request rejected because the host circuit breaker is open """
+    pass
+
+
+class CircuitBreaker():
+    """
+    Stop requesting a host after consecutive failures.
+
+    The circuit opens after `threshold` failures and rejects requests until
+    `reset_timeout` seconds have passed. Then a single probe request is let
+    through (half-open): success closes the circuit, failure re-opens it.
+    A probe left unresolved, e.g. cancelled, is replaced after another
+    `reset_timeout` seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, host, threshold, reset_timeout):
+        self.host = host
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        """ Check if a request to the host can be made """
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if timer() - self.opened_at >= self.reset_timeout:
+                log.info(f'Circuit for {self.host} half-open, probing host.')
+                self.state = self.HALF_OPEN
+                self.opened_at = timer()
+                return True
+
+            return False
+
+    def success(self):
+        with self.lock:
+            if self.state != self.CLOSED:
+                log.info(f'Circuit for {self.host} closed.')
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    log.warning(f'Circuit for {self.host} open after '
+                                f'{self.failures} failures.')
+                self.state = self.OPEN
+                self.opened_at = timer()
+
+
+class RetryState():
+    """ Attempts made for a single request """
+
+    def __init__(self, policy, breaker):
+        self.policy = policy
+        self.breaker = breaker
+        self.attempts = 0
+        self.deadline = timer() + policy.budget
+
+    def is_last(self) -> bool:
+        """ Check if the next attempt is the last one """
+        return self.attempts + 1 >= self.policy.retries
+
+    def timeout(self, timeout) -> float:
+        """ Limit a request timeout to the remaining time budget """
+        return max(0.1, min(timeout, self.deadline - timer()))
+
+    def begin(self):
+        """ Start a new attempt, raises CircuitOpen if the host is failing """
+        if not self.breaker.allow():
+            self.policy.count('rejected')
+            raise CircuitOpen(f'Circuit for {self.breaker.host} is open.')
+
+        self.attempts += 1
+        self.policy.count('attempts')
+
+    def success(self):
+        self.breaker.success()
+
+    def failure(self, error=None):
+        """
+        Record a failed attempt.
+
+        Returns:
+            float: delay in seconds before the next attempt or None to give up.
+        """
+        self.policy.count('failures')
+        if not self.policy.is_retryable(error):
+            # The host replied, or the error is not a host failure. A half-open
+            # probe must be resolved, the circuit would stay half-open otherwise.
+            if (self.policy.error_status(error) is not None or
+                    self.breaker.state == CircuitBreaker.HALF_OPEN):
+                self.breaker.success()
+            return None
+
+        self.breaker.failure()
+        if self.breaker.state == CircuitBreaker.OPEN:
+            return None
+
+        if self.attempts >= self.policy.retries:
+            self.policy.count('exhausted')
+            return None
+
+        delay = self.policy.backoff(self.attempts, error)
+        if timer() + delay >= self.deadline:
+            log.debug('Retry time budget exhausted.')
+            self.policy.count('exhausted')
+            return None
+
+        self.policy.count('retries')
+        return delay
+
+
+class RetryPolicy():
+    """ Singleton retry policy with per-host circuit breakers and metrics """
+    __policy = None
+    __lock = Lock()
+
+    STATUS_FORCELIST = [413, 429, 500, 502, 503, 504]
+    # Network errors worth another attempt, anything else is not retried
+    RETRY_ERRORS = (ConnectionError, Timeout, ClientConnectionError, asyncio.TimeoutError)
+    # Errors of the request itself, not of the host
+    FATAL_ERRORS = (InvalidURL, MissingSchema, InvalidSchema, ClientInvalidURL)
+
+    @staticmethod
+    def get_policy():
+        """ Static access method """
+        with RetryPolicy.__lock:
+            if RetryPolicy.__policy is None:
+                args = Config.get_args()
+                RetryPolicy.__policy = RetryPolicy(
+                    retries=args.scrapper_retries,
+                    backoff_factor=args.scrapper_backoff_factor,
+                    budget=args.scrapper_budget,
+                    threshold=args.scrapper_breaker_threshold,
+                    reset_timeout=args.scrapper_breaker_timeout)
+
+        return RetryPolicy.__policy
+
+    def __init__(self, retries, backoff_factor, budget, threshold, reset_timeout):
+        self.retries = max(1, retries)
+        self.backoff_factor = backoff_factor
+        self.budget = budget
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.lock = Lock()
+        self.breakers = {}
+        self.metrics = {
+            'attempts': 0,
+            'failures': 0,
+            'retries': 0,
+            'exhausted': 0,
+            'rejected': 0
+        }
+
+    def start(self, url) -> RetryState:
+        """ Begin tracking the attempts of a request to URL """
+        return RetryState(self, self.breaker(url))
+
+    def breaker(self, url) -> CircuitBreaker:
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host, self.threshold, self.reset_timeout)
+
+            return self.breakers[host]
+
+    def count(self, metric):
+        with self.lock:
+            self.metrics[metric] += 1
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats['open_circuits'] = [
+                host for host, breaker in self.breakers.items()
+                if breaker.state != CircuitBreaker.CLOSED]
+
+        return stats
+
+    @staticmethod
+    def error_status(error):
+        """ HTTP status code of requests or aiohttp response errors """
+        response = getattr(error, 'response', None)
+        status = getattr(response, 'status_code', None)
+        return status or getattr(error, 'status', None)
+
+    @staticmethod
+    def error_headers(error):
+        response = getattr(error, 'response', None)
+        return getattr(response, 'headers', None) or getattr(error, 'headers', None) or {}
+
+    def is_retryable(self, error) -> bool:
+        if error is None:
+            return True
+
+        if isinstance(error, self.FATAL_ERRORS):
+            return False
+
+        status = self.error_status(error)
+        if status is not None:
+            return status in self.STATUS_FORCELIST
+
+        return isinstance(error, self.RETRY_ERRORS)
+
+    def backoff(self, attempt, error=None) -> float:
+        """ Exponential backoff delay, or the server Retry-After if longer """
+        delay = self.backoff_factor * 2 ** (attempt - 1)
+
+        retry_after = self.error_headers(error).get('Retry-After', '')
+        if retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+
+        return delay
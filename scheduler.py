@@ -0,0 +1,72 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+from datetime import datetime, time, timedelta
+
+from config import Config
+
+log = logging.getLogger(__name__)
+
+
+class Scheduler():
+    """ Keep scrappers running periodically, each on its own schedule """
+    MAINTENANCE_INTERVAL = timedelta(days=1)
+
+    def __init__(self, orchestrator, interrupt, maintenance=None):
+        self.args = Config.get_args()
+        self.orchestrator = orchestrator
+        self.interrupt = interrupt
+        self.maintenance = maintenance
+        # Maintenance already ran at startup
+        self.next_maintenance = datetime.utcnow() + self.MAINTENANCE_INTERVAL
+
+    def next_run(self, scrapper, now):
+        """
+        Compute when a scrapper should run next.
+
+        Runs happen every scrapper frequency or at the next time the bank
+        publishes quotes, whichever comes first, plus a random jitter.
+        """
+        frequency = scrapper.FREQUENCY or self.args.scrapper_frequency
+        next_run = now + timedelta(seconds=frequency)
+
+        for publish_time in scrapper.PUBLISH_TIMES:
+            publish = datetime.combine(now.date(), time.fromisoformat(publish_time))
+            if publish <= now:
+                publish += timedelta(days=1)
+            next_run = min(next_run, publish)
+
+        jitter = random.uniform(0, self.args.scrapper_jitter)
+        return next_run + timedelta(seconds=jitter)
+
+    def run(self):
+        """ Run due scrappers and sleep until the next one is scheduled """
+        now = datetime.utcnow()
+        schedule = {scrapper: now for scrapper in self.orchestrator.scrappers}
+
+        while schedule and not self.interrupt.is_set():
+            now = datetime.utcnow()
+            if self.maintenance and self.next_maintenance <= now:
+                self.maintenance()
+                self.next_maintenance = now + self.MAINTENANCE_INTERVAL
+
+            due = [scrapper for scrapper, when in schedule.items() if when <= now]
+
+            if due:
+                self.orchestrator.run(due)
+
+                now = datetime.utcnow()
+                for scrapper in due:
+                    schedule[scrapper] = self.next_run(scrapper, now)
+                    log.info(f'Next {scrapper.name} run at '
+                             f'{schedule[scrapper]:%Y-%m-%d %H:%M:%S} UTC.')
+                continue
+
+            wake_up = min(schedule.values())
+            if self.maintenance:
+                wake_up = min(wake_up, self.next_maintenance)
+            self.interrupt.wait((wake_up - now).total_seconds())
+
+        log.info('Scheduler stopped.')
@@ -1,176 +1,455 @@
-#!/usr/bin/python
-# -*- coding: utf-8 -*-
-
-import logging
-import requests
-from timeit import default_timer as timer
-from threading import Thread
-
-from abc import ABC, abstractmethod
-from urllib3.util.retry import Retry
-from urllib3.exceptions import MaxRetryError
-from requests.adapters import HTTPAdapter
-from requests.exceptions import ConnectionError, HTTPError
-
-from config import Config
-from user_agent import UserAgent
-from utils import export_file, http_headers
-
-log = logging.getLogger(__name__)
-
-
-class Scrapper(ABC, Thread):
-
-    STATUS_FORCELIST = [413, 429, 500, 502, 503, 504]
-
-    def __init__(self, name):
-        ABC.__init__(self)
-        Thread.__init__(self, name=name, daemon=False)
-        args = Config.get_args()
-        self.args = args
-
-        self.debug = args.verbose
-        self.download_path = args.download_path
-        self.timeout = args.scrapper_timeout
-        self.proxy_url = args.scrapper_proxy
-
-        self.name = name
-        self.user_agent = UserAgent.generate(args.user_agent)
-        self.session = None
-        self.retries = Retry(
-            allowed_methods=None,  # retry on all HTTP verbs
-            total=args.scrapper_retries,
-            backoff_factor=args.scrapper_backoff_factor,
-            status_forcelist=self.STATUS_FORCELIST)
-
-        self.setup_session()
-        log.info('Initialized scrapper: %s.', name)
-
-    def setup_session(self):
-        self.session = requests.Session()
-        # Mount handler on both HTTP & HTTPS
-        adapter = HTTPAdapter(max_retries=self.retries)
-        self.session.mount('http://', adapter)
-        self.session.mount('https://', adapter)
-
-    def setup_proxy(self, no_proxy=False):
-        proxy_url = None
-        if not no_proxy and self.proxy_url:
-            proxy_url = self.proxy_url
-
-        self.session.proxies = {'http': proxy_url, 'https': proxy_url}
-
-    def make_request(self, url, referer=None, post={}, json=False):
-        headers = http_headers()
-        headers['User-Agent'] = self.user_agent
-        headers['Referer'] = referer or 'https://www.google.com'
-
-        if post:
-            headers['Content-Type'] = 'application/x-www-form-urlencoded'
-            response = self.session.post(
-                url,
-                timeout=self.timeout,
-                headers=headers,
-                data=post)
-        else:
-            response = self.session.get(
-                url,
-                timeout=self.timeout,
-                headers=headers)
-
-        response.raise_for_status()
-
-        if json:
-            content = response.json()
-        else:
-            content = response.text
-
-        response.close()
-        return content
-
-    def request_url(self, url, referer=None, post={}, json=False):
-        error_count = 0
-        no_proxy = False
-        while True:
-            if error_count > 4:
-                log.error('Failed to scrap webpage.')
-                break
-            start_t = timer()
-            try:
-                if error_count == 4:
-                    log.debug('Not using proxy for next request.')
-                    no_proxy = True
-                    continue
-                self.setup_proxy(no_proxy)
-                content = self.make_request(url, referer, post, json)
-                if not content:
-                    error_count += 1
-                    continue
-
-                return content
-            except MaxRetryError as e:
-                log.error(f'MaxRetryError: {e.reason}')
-            except ConnectionError as e:
-                log.error(f'Connection error: {e}')
-            except HTTPError as e:
-                log.error(f'HTTP error: {e}')
-            except Exception as e:
-                log.exception('Failed to request URL "%s": %s', url, e)
-
-            log.debug(f'Request took: {timer()-start_t}')
-            error_count += 1
-
-        return None
-
-    def download_file(self, url, filename, referer=None, use_proxy=False):
-        result = False
-        try:
-            # Setup request headers
-            headers = http_headers(keep_alive=True)
-            headers['User-Agent'] = self.user_agent
-            headers['Referer'] = referer or 'https://www.google.com'
-
-            if use_proxy:
-                self.setup_proxy()
-
-            response = self.session.get(
-                url,
-                # proxies={'http': self.proxy, 'https': self.proxy},
-                timeout=self.timeout,
-                headers=headers)
-
-            response.raise_for_status()
-
-            with open(filename, 'wb') as fd:
-                for chunk in response.iter_content(chunk_size=128):
-                    fd.write(chunk)
-                result = True
-
-            response.close()
-        except Exception as e:
-            log.exception('Failed to download file "%s": %s.', url, e)
-
-        return result
-
-    def export_webpage(self, soup, filename):
-        content = soup.prettify()  # .encode('utf8')
-        filename = '{}/{}'.format(self.download_path, filename)
-
-        export_file(filename, content)
-        log.debug('Web page output saved to: %s', filename)
-
-    def run(self):
-        try:
-            log.debug(f'{self.name} scrapper started.')
-            self.scrap()
-            log.debug(f'{self.name} scrapper stopped.')
-
-        except Exception as e:
-            log.exception(f'{self.name} scrapper failed: {e}')
-
-    @abstractmethod
-    def scrap(self):
-        """
-        Scrap and store relevant web content.
-        """
-        pass
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import requests
+import zlib
+from timeit import default_timer as timer
+from threading import Event, Thread
+
+from abc import ABC, abstractmethod
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from archive import PageArchive
+from config import Config
+from db import Database
+from models import DBConfig, Quote, WebPage
+from retry import CircuitOpen, RetryPolicy
+from sink import QuoteSink
+from user_agent import UserAgent
+from utils import export_file, http_headers
+
+log = logging.getLogger(__name__)
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+
+class PageNotModified(Exception):
+    """ Requested web page did not change since it was last scrapped """
+    pass
+
+
+class Scrapper(ABC, Thread):
+
+    # Bank name, declares the class as a scrapper of the funds package.
+    # Literal attributes below are read by the registry without importing it.
+    BANK = None
+    FREQUENCY = None  # seconds between runs, defaults to --scrapper-frequency
+    PUBLISH_TIMES = []  # UTC times of day ('HH:MM') when the bank publishes new quotes
+    PARSER = None  # HTML parser backend, defaults to --scrapper-parser
+    PARSE_ONLY = None  # SoupStrainer limiting which tags are parsed
+
+    def __init__(self, name):
+        ABC.__init__(self)
+        Thread.__init__(self, name=name, daemon=False)
+        args = Config.get_args()
+        self.args = args
+
+        self.debug = args.verbose
+        self.download_path = args.download_path
+        self.chunk_size = args.download_chunk_size * 1024
+        self.timeout = args.scrapper_timeout
+        self.proxy_url = args.scrapper_proxy
+        parser = self.PARSER or args.scrapper_parser
+        self.parser = HTML_PARSER if parser == 'auto' else parser
+
+        self.name = name
+        self.interrupt = Event()
+        self.status = 'idle'
+        self.result = None
+        self.elapsed = None
+        self.start_t = None
+        self.user_agent = UserAgent.generate(args.user_agent)
+        self.session = None
+        self.pool_size = args.scrapper_pool_size
+        self.idle_timeout = args.scrapper_idle_timeout
+        self.last_request = timer()
+        self.closed_stats = (0, 0)
+        self.pages = {}
+        self.retry_policy = RetryPolicy.get_policy()
+        self.archive = PageArchive.get_archive()
+
+        self.setup_session()
+        log.info('Initialized scrapper: %s.', name)
+
+    def setup_session(self):
+        self.session = requests.Session()
+        # Mount handler on both HTTP & HTTPS
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,  # number of hosts kept in pool
+            pool_maxsize=self.pool_size,  # connections kept per host
+            max_retries=0)  # retries are handled by request_url
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def check_idle_connections(self):
+        """ Drop pooled connections left idle longer than the idle timeout """
+        now = timer()
+        if now - self.last_request > self.idle_timeout:
+            log.debug(f'{self.name} connections idle, closing connection pool.')
+            self.closed_stats = self.connection_stats()
+            self.session.close()
+
+        self.last_request = now
+
+    def connection_stats(self):
+        """ Total number of HTTP requests made and connections opened """
+        request_count, connection_count = self.closed_stats
+        adapters = {id(a): a for a in self.session.adapters.values()}
+
+        for adapter in adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                request_count += pool.num_requests
+                connection_count += pool.num_connections
+
+        return request_count, connection_count
+
+    def connection_reuse(self):
+        """ Ratio of HTTP requests served by an already open connection """
+        request_count, connection_count = self.connection_stats()
+        if not request_count:
+            return 0.0
+
+        return 1.0 - min(connection_count, request_count) / request_count
+
+    def setup_proxy(self, no_proxy=False):
+        proxy_url = None
+        if not no_proxy and self.proxy_url:
+            proxy_url = self.proxy_url
+
+        self.session.proxies = {'http': proxy_url, 'https': proxy_url}
+
+    def make_request(self, url, referer=None, post={}, json=False, cache=False,
+                     timeout=None):
+        self.check_idle_connections()
+        timeout = timeout or self.timeout
+
+        headers = http_headers(keep_alive=True)
+        headers['User-Agent'] = self.user_agent
+        headers['Referer'] = referer or 'https://www.google.com'
+
+        cache = cache and not post
+        if cache:
+            page = WebPage.get_page(url)
+            headers.update(self.conditional_headers(page))
+
+        if post:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            response = self.session.post(
+                url,
+                timeout=timeout,
+                headers=headers,
+                data=post)
+        else:
+            response = self.session.get(
+                url,
+                timeout=timeout,
+                headers=headers)
+
+        response.raise_for_status()
+
+        if cache:
+            self.check_page(url, page, response.status_code, response.headers,
+                            response.content)
+
+        if self.archive:
+            self.archive.record(self.name, url, response.content,
+                                None if json else response.encoding)
+
+        if json:
+            content = response.json()
+        else:
+            content = response.text
+
+        response.close()
+        return content
+
+    def conditional_headers(self, page):
+        """ Build conditional GET headers from stored page validators """
+        headers = {}
+        if page is None:
+            return headers
+
+        if page.etag:
+            headers['If-None-Match'] = page.etag
+        if page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+
+        return headers
+
+    def check_page(self, url, page, status_code, headers, body):
+        """
+        Raise PageNotModified if the server replied 304 or the page content
+        is unchanged, otherwise keep its validators to be saved after scrap().
+        """
+        if status_code == 304:
+            raise PageNotModified(f'{url} was not modified (HTTP 304).')
+
+        content_hash = WebPage.hash(body)
+        if page and page.content_hash == content_hash:
+            raise PageNotModified(f'{url} content is unchanged.')
+
+        self.pages[url] = {
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'content_hash': content_hash
+        }
+
+    def save_pages(self):
+        """
+        Store validators of pages that were successfully scrapped, along with
+        their quotes when those are written by the sink.
+        """
+        sink = QuoteSink.get_sink()
+        if sink is not None:
+            sink.submit_pages(self.pages)
+        else:
+            for url, validators in self.pages.items():
+                WebPage.save_page(url, **validators)
+        self.pages.clear()
+
+    def request_url(self, url, referer=None, post={}, json=False, cache=False):
+        retry = self.retry_policy.start(url)
+        while not self.interrupt.is_set():
+            start_t = timer()
+            try:
+                # Last attempt is made without proxy
+                self.setup_proxy(no_proxy=retry.is_last())
+                retry.begin()
+                content = self.make_request(url, referer, post, json, cache,
+                                            timeout=retry.timeout(self.timeout))
+                retry.success()
+                return content
+            except PageNotModified:
+                # The host answered
+                retry.success()
+                raise
+            except CircuitOpen as e:
+                log.warning(f'Skipped request to {url}: {e}')
+                return None
+            except Exception as e:
+                self.log_request_error(url, e)
+                delay = retry.failure(e)
+
+            log.debug(f'Request took: {timer()-start_t}')
+            if delay is None:
+                break
+            self.interrupt.wait(delay)
+
+        log.error(f'Failed to scrap webpage after {retry.attempts} attempts: {url}')
+        return None
+
+    def log_request_error(self, url, error):
+        status = self.retry_policy.error_status(error)
+        if status is not None:
+            log.error(f'HTTP error {status} requesting {url}.')
+        elif isinstance(error, RetryPolicy.RETRY_ERRORS):
+            log.error(f'Connection error requesting {url}: {error!r}')
+        else:
+            log.exception('Failed to request URL "%s": %s', url, error)
+
+    def download_file(self, url, filename, referer=None, use_proxy=False, decompress=False):
+        """
+        Stream URL content into filename without buffering it in memory.
+
+        Content is written to "<filename>.part" and renamed once complete.
+        An existing partial file is resumed with a HTTP Range request.
+        With decompress, gzip/zlib content is inflated while downloading
+        (no resume, offsets would not match).
+        """
+        result = False
+        partial = f'{filename}.part'
+        try:
+            # Setup request headers
+            headers = http_headers(keep_alive=True)
+            headers['User-Agent'] = self.user_agent
+            headers['Referer'] = referer or 'https://www.google.com'
+
+            offset = 0
+            if not decompress and os.path.exists(partial):
+                offset = os.path.getsize(partial)
+                headers['Range'] = f'bytes={offset}-'
+                # Range offsets must refer to the stored (decoded) content
+                headers['Accept-Encoding'] = 'identity'
+
+            if use_proxy:
+                self.setup_proxy()
+
+            with self.session.get(
+                    url,
+                    timeout=self.timeout,
+                    headers=headers,
+                    stream=True) as response:
+
+                if offset and response.status_code == 416:
+                    log.debug(f'Download of {filename} was already complete.')
+                else:
+                    response.raise_for_status()
+                    self.write_stream(response, partial, offset, decompress)
+
+            os.replace(partial, filename)
+            result = True
+        except Exception as e:
+            log.exception('Failed to download file "%s": %s.', url, e)
+
+        return result
+
+    def write_stream(self, response, filename, offset=0, decompress=False):
+        """ Write response content to filename in chunks """
+        if response.status_code == 206:
+            log.debug(f'Resuming download of {filename} from byte {offset}.')
+            mode = 'ab'
+        else:
+            mode = 'wb'
+
+        # Detect gzip or zlib headers automatically
+        decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS) if decompress else None
+
+        with open(filename, mode) as fd:
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                if decompressor:
+                    chunk = decompressor.decompress(chunk)
+                fd.write(chunk)
+
+            if decompressor:
+                fd.write(decompressor.flush())
+
+    def save_quotes(self, rows, history=False):
+        """
+        Submit quote rows to the write-behind sink, or write them now without one.
+        History rows skip days a fund already has a quote. Returns the number
+        of quotes written, None when the sink writes them later.
+        """
+        kind = 'historical quotes' if history else 'quotes'
+        sink = QuoteSink.get_sink()
+        if sink is not None:
+            sink.submit(rows, history)
+            log.info(f'Queued {len(rows)} {kind} from {self.name}.')
+            return None
+
+        if history:
+            count = Quote.insert_history(rows, Database.BATCH_SIZE)
+        else:
+            count = Quote.upsert_batch(rows, Database.BATCH_SIZE)
+        log.info(f'Stored {count} {kind} from {self.name}.')
+        return count
+
+    @staticmethod
+    def make_soup(content, parser=None, parse_only=None):
+        """
+        Parse HTML content with the given backend, lxml when installed by default.
+        Only the tags matched by parse_only are built when given.
+        """
+        return BeautifulSoup(content, parser or HTML_PARSER, parse_only=parse_only)
+
+    def export_webpage(self, soup, filename):
+        content = soup.prettify()  # .encode('utf8')
+        filename = '{}/{}'.format(self.download_path, filename)
+
+        export_file(filename, content)
+        log.debug('Web page output saved to: %s', filename)
+
+    def run(self):
+        self.begin_run()
+        try:
+            with WebPage.database().connection_context():
+                result = self.scrap()
+                self.finish_run(result)
+        except Exception as e:
+            self.fail_run(e)
+
+    def begin_run(self):
+        self.status = 'running'
+        self.result = None
+        self.pages.clear()
+        self.start_t = timer()
+        log.debug(f'{self.name} scrapper started.')
+
+    def finish_run(self, result):
+        """ Save page validators and flag new quotes, requires a database connection """
+        self.save_pages()
+        if result:
+            DBConfig.update_quotes_version()
+
+        self.result = result
+        self.status = 'finished'
+        self.elapsed = timer() - self.start_t
+        log.debug(f'{self.name} scrapper stopped.')
+
+    def fail_run(self, error):
+        if isinstance(error, PageNotModified):
+            self.status = 'unchanged'
+            log.info(f'{self.name} scrapper skipped: {error}')
+        else:
+            self.status = 'failed'
+            log.error(f'{self.name} scrapper failed: {error}', exc_info=error)
+
+        self.elapsed = timer() - self.start_t
+
+    def get_result(self):
+        """ Outcome of the last run: status, scrap() result and timing """
+        return {
+            'name': self.name,
+            'status': self.status,
+            'result': self.result,
+            'elapsed': self.elapsed or 0.0,
+            'connection_reuse': self.connection_reuse()
+        }
+
+    def is_async(self):
+        """ Scrapper runs on the asyncio event loop """
+        return False
+
+    def is_staged(self):
+        """ Scrapper implements the fetch, parse and store stages of the pipeline """
+        return isinstance(self, StagedScrapper)
+
+    @abstractmethod
+    def scrap(self):
+        """
+        Scrap and store relevant web content.
+        """
+        pass
+
+
+class StagedScrapper(Scrapper):
+    """
+    Scrapper split in fetch, parse and store stages, which the pipeline runs
+    in fetcher threads, parser processes and the database writer.
+    """
+
+    def scrap(self):
+        content = self.fetch()
+        return self.store(self.parse_content(content, self.parser, self.PARSE_ONLY))
+
+    @abstractmethod
+    def fetch(self):
+        """
+        Download the content to parse, first stage of the scrapping pipeline.
+        """
+        pass
+
+    @classmethod
+    @abstractmethod
+    def parse_content(cls, content, parser, parse_only=None, now=None):
+        """
+        Parse downloaded content into picklable data, "now" is the UTC time
+        it was downloaded when parsing archived pages.
+        Runs in a parser process, it must not use the scrapper instance.
+        """
+        pass
+
+    @abstractmethod
+    def store(self, parsed):
+        """
+        Store parsed data and return the scrap result, runs in the database writer.
+        """
+        pass
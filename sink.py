@@ -0,0 +1,210 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from threading import Condition, Lock, Thread
+
+from peewee import OperationalError
+
+from config import Config
+from db import Database
+from models import DBConfig, Quote, WebPage
+
+log = logging.getLogger(__name__)
+
+
+class QuoteSink(Thread):
+    """
+    Write-behind buffer of quotes shared by all scrappers.
+
+    Submitted quotes are written by this thread when the buffer reaches the
+    database batch size or after the flush interval, each flush in a single
+    transaction (group commit). Validators of the scrapped pages are written
+    in the same transaction as their quotes, or a later one, so unchanged
+    pages are never skipped before their quotes are stored.
+
+    Failed flushes keep their rows for the next flush, retried with backoff.
+    Rows failing with errors other than lost connections, deadlocks or lock
+    timeouts, or still failing when the sink is closed, are saved to a file.
+    """
+    __sink = None
+    __lock = Lock()
+
+    RETRIES = 3
+    BACKOFF = 0.5  # seconds before the first retry, doubled on each retry
+    MAX_BACKOFF = 30.0
+
+    @staticmethod
+    def get_sink():
+        """ Running sink, None when quotes are written directly """
+        return QuoteSink.__sink
+
+    @staticmethod
+    def start_sink():
+        with QuoteSink.__lock:
+            if QuoteSink.__sink is None:
+                args = Config.get_args()
+                QuoteSink.__sink = QuoteSink(Database.BATCH_SIZE, args.db_flush_interval,
+                                             args.download_path)
+                QuoteSink.__sink.start()
+
+        return QuoteSink.__sink
+
+    @staticmethod
+    def stop_sink():
+        """ Write buffered quotes and stop the sink """
+        with QuoteSink.__lock:
+            sink = QuoteSink.__sink
+            QuoteSink.__sink = None
+
+        if sink is not None:
+            sink.close()
+
+    def __init__(self, batch_size, interval, spill_path):
+        Thread.__init__(self, name='quote-sink', daemon=True)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.spill_path = spill_path
+        self.condition = Condition()
+        self.quotes = []
+        self.history = []
+        self.pages = {}
+        self.closed = False
+        self.flushes = 0
+        self.written = 0
+        self.spilled = 0
+
+    def pending(self):
+        return len(self.quotes) + len(self.history)
+
+    def submit(self, rows, history=False):
+        """ Buffer quote rows, history rows skip days a fund already has a quote """
+        with self.condition:
+            self.check_running()
+            if history:
+                self.history.extend(rows)
+            else:
+                self.quotes.extend(rows)
+
+            if self.pending() >= self.batch_size:
+                self.condition.notify()
+
+    def submit_pages(self, pages):
+        """ Buffer page validators, written once the quotes submitted before are """
+        with self.condition:
+            self.check_running()
+            self.pages.update(pages)
+
+    def check_running(self):
+        if self.closed:
+            raise RuntimeError('Quote sink is closed.')
+        if not self.is_alive():
+            raise RuntimeError('Quote sink is not running.')
+
+    def run(self):
+        failures = 0
+        closing = False
+        while True:
+            with self.condition:
+                if not (self.closed or failures) and self.pending() < self.batch_size:
+                    self.condition.wait(self.interval)
+
+                quotes, self.quotes = self.quotes, []
+                history, self.history = self.history, []
+                pages, self.pages = self.pages, {}
+                closed = self.closed
+
+            if closed and not closing:
+                # Retries of the last flush are counted from here
+                closing = True
+                failures = 0
+
+            error = self.flush(quotes, history, pages)
+            if error is None:
+                failures = 0
+            else:
+                failures += 1
+                transient = isinstance(error, OperationalError) and not closed
+                if failures >= self.RETRIES and not transient:
+                    self.spill(quotes, history, error)
+                    failures = 0
+                else:
+                    self.restore(quotes, history, pages)
+                    delay = min(self.BACKOFF * 2 ** (failures - 1), self.MAX_BACKOFF)
+                    log.warning(f'Quote sink write failed: {error}. '
+                                f'Retrying in {delay:.1f}s.')
+                    time.sleep(delay)
+                    continue
+
+            if closed:
+                break
+
+        log.info(f'Quote sink stopped: {self.written} quotes written in '
+                 f'{self.flushes} transactions, {self.spilled} saved to files.')
+
+    def flush(self, quotes, history, pages):
+        """ Write quotes and page validators in one transaction, return the error if failed """
+        count = len(quotes) + len(history)
+        if not count and not pages:
+            return None
+
+        try:
+            with Quote.database().connection_context():
+                with Quote.database().atomic():
+                    if quotes:
+                        Quote.upsert_batch(quotes, self.batch_size)
+                    if history:
+                        Quote.insert_history(history, self.batch_size)
+                    for url, validators in pages.items():
+                        WebPage.save_page(url, **validators)
+
+                if count:
+                    DBConfig.update_quotes_version()
+        except Exception as e:
+            if not isinstance(e, OperationalError):
+                log.exception(f'Quote sink failed to write {count} quotes: {e}')
+            return e
+
+        self.flushes += 1
+        self.written += count
+        log.debug(f'Quote sink wrote {count} quotes and {len(pages)} pages.')
+        return None
+
+    def restore(self, quotes, history, pages):
+        """ Put back rows of a failed flush, ahead of rows submitted since """
+        with self.condition:
+            self.quotes[:0] = quotes
+            self.history[:0] = history
+            # Validators submitted since are more recent
+            self.pages = {**pages, **self.pages}
+
+    def spill(self, quotes, history, error):
+        """
+        Save rows that cannot be written to a JSON file. Their page validators
+        are discarded, the pages are scrapped again next time.
+        """
+        count = len(quotes) + len(history)
+        filename = os.path.join(
+            self.spill_path, f'quote-sink-{datetime.now():%Y%m%d-%H%M%S-%f}.json')
+        try:
+            with open(filename, 'w', encoding='utf-8') as file:
+                json.dump({'quotes': quotes, 'history': history}, file, default=str)
+        except OSError as e:
+            log.error(f'Quote sink lost {count} quotes, unable to save them: {e}')
+            return
+
+        self.spilled += count
+        log.error(f'Quote sink saved {count} quotes to {filename} after '
+                  f'{self.RETRIES} failed writes: {error}')
+
+    def close(self):
+        """ Stop accepting quotes and wait until the buffer is written """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        self.join()
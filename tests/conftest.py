@@ -0,0 +1,89 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import pytest
+from peewee import SqliteDatabase
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from config import Config  # noqa: E402
+from db import Database  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def args(tmp_path_factory):
+    """ Application configuration, parsed once like in the application """
+    path = tmp_path_factory.mktemp('app')
+    argv = sys.argv
+    sys.argv = ['app.py', '--db-engine', 'sqlite', '--db-name', str(path / 'quotes'),
+                '--log-path', str(path), '--download-path', str(path),
+                '-Sbf', '0.01']
+    try:
+        return Config.get_args()
+    finally:
+        sys.argv = argv
+
+
+@pytest.fixture
+def database(tmp_path):
+    """ Application models bound to an empty SQLite database """
+    database = SqliteDatabase(str(tmp_path / 'test.db'), pragmas={'foreign_keys': 1})
+    database.bind(Database.MODELS)
+    database.create_tables(Database.MODELS)
+    yield database
+    database.close()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+
+        try:
+            time.sleep(server.latency)
+            status, body, headers = server.respond(self)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """
+    Local HTTP server, set its respond(request) function returning
+    (status, body, headers) and its latency in seconds.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = Lock()
+    server.requests = []
+    server.active = 0
+    server.max_active = 0
+    server.latency = 0.0
+    server.respond = lambda request: (200, b'<html></html>', {'Content-Type': 'text/html'})
+    server.url = lambda path='/': f'http://127.0.0.1:{server.server_port}{path}'
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
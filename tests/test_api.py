@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+import pytest
+
+from api import create_app
+from models import DBConfig, Fund, Quote
+
+
+@pytest.fixture
+def client(database, args, monkeypatch):
+    monkeypatch.setattr(args, 'api_page_size', 2)
+    monkeypatch.setattr(args, 'api_cache_check', 1e-6)
+    return create_app().test_client()
+
+
+@pytest.fixture
+def fund(database):
+    fund = Fund.create(bank='CGD', name='Caixa Acções')
+    Quote.insert_many([{'fund': fund.id, 'quote_date': date(2024, 1, day), 'value': day}
+                       for day in (2, 3, 4)]).execute()
+    return fund
+
+
+@pytest.mark.parametrize('limit', [0, -5, 1])
+def test_limit_is_clamped_to_one_quote(client, fund, limit):
+    response = client.get(f'/funds/{fund.id}/quotes?limit={limit}')
+
+    assert response.status_code == 200
+    assert len(response.json['quotes']) == 1
+
+
+def test_quotes_are_paginated_by_id(client, fund):
+    first = client.get(f'/funds/{fund.id}/quotes?limit=50').json
+    assert [quote['value'] for quote in first['quotes']] == [2, 3]
+
+    second = client.get(f'/funds/{fund.id}/quotes?after={first["next"]}').json
+    assert [quote['value'] for quote in second['quotes']] == [4]
+    assert second['next'] is None
+
+
+def test_empty_page_has_no_next(client, fund):
+    response = client.get(f'/funds/{fund.id}/quotes?from=2025-01-01')
+
+    assert response.json == {'fund': fund.id, 'quotes': [], 'next': None}
+
+
+def test_unknown_fund_is_not_found(client, fund):
+    assert client.get(f'/funds/{fund.id + 1}/quotes').status_code == 404
+
+
+def test_invalid_date_is_rejected(client, fund):
+    assert client.get(f'/funds/{fund.id}/quotes?from=yesterday').status_code == 400
+
+
+def test_unchanged_response_is_not_modified(client, fund):
+    response = client.get('/funds')
+    etag = response.headers['ETag']
+
+    cached = client.get('/funds', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+
+
+def test_cache_is_cleared_when_quotes_change(client, fund):
+    before = client.get('/quotes/latest')
+    assert before.json[0]['value'] == 4
+
+    Quote.create(fund=fund, quote_date=date(2024, 1, 5), value=5)
+    DBConfig.update_quotes_version()
+
+    after = client.get('/quotes/latest', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.json[0]['value'] == 5
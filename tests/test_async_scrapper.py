@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import pytest
+
+from async_scrapper import AsyncScrapper
+
+pytest.importorskip('aiohttp')
+
+
+class StubScrapper(AsyncScrapper):
+    """ Requests the same page a number of times concurrently """
+
+    def __init__(self, url, count=1):
+        AsyncScrapper.__init__(self, name='Stub')
+        self.url = url
+        self.count = count
+
+    async def scrap(self):
+        pages = await asyncio.gather(*(self.request_url(self.url) for _ in range(self.count)))
+        return len([page for page in pages if page is not None])
+
+
+def test_run_fetches_pages(database, http_server):
+    scrapper = StubScrapper(http_server.url('/page'), count=3)
+    scrapper.run()
+
+    assert scrapper.get_result()['status'] == 'finished'
+    assert scrapper.get_result()['result'] == 3
+    assert http_server.requests == ['/page'] * 3
+
+
+def test_requests_per_host_are_limited(database, http_server, args, monkeypatch):
+    monkeypatch.setattr(args, 'scrapper_host_limit', 2)
+    http_server.latency = 0.05
+    scrapper = StubScrapper(http_server.url('/page'), count=6)
+    scrapper.run()
+
+    assert scrapper.get_result()['result'] == 6
+    assert http_server.max_active == 2
+
+
+def test_failed_request_is_retried(database, http_server):
+    def respond(request):
+        if len(http_server.requests) == 1:
+            return 503, b'', {}
+        return 200, b'quotes', {'Content-Type': 'text/html; charset=utf-8'}
+
+    http_server.respond = respond
+    scrapper = StubScrapper(http_server.url('/page'))
+
+    async def request():
+        try:
+            return await scrapper.request_url(scrapper.url)
+        finally:
+            await scrapper.close_session()
+
+    assert asyncio.run(request()) == 'quotes'
+    assert len(http_server.requests) == 2
+
+
+def test_download_file(database, http_server, tmp_path):
+    http_server.respond = lambda request: (200, b'quotes' * 1000, {})
+    filename = str(tmp_path / 'quotes.csv')
+    scrapper = StubScrapper(http_server.url('/file'))
+
+    async def download():
+        try:
+            return await scrapper.download_file(http_server.url('/file'), filename)
+        finally:
+            await scrapper.close_session()
+
+    assert asyncio.run(download())
+    with open(filename, 'rb') as file:
+        assert file.read() == b'quotes' * 1000
+
+
+def test_download_file_is_resumed(database, http_server, tmp_path):
+    content = b'0123456789' * 100
+
+    def respond(request):
+        offset = int(request.headers['Range'][len('bytes='):-1])
+        return 206, content[offset:], {'Content-Range': f'bytes {offset}-999/1000'}
+
+    http_server.respond = respond
+    filename = tmp_path / 'quotes.csv'
+    (tmp_path / 'quotes.csv.part').write_bytes(content[:300])
+    scrapper = StubScrapper(http_server.url('/file'))
+
+    async def download():
+        try:
+            return await scrapper.download_file(http_server.url('/file'), str(filename))
+        finally:
+            await scrapper.close_session()
+
+    assert asyncio.run(download())
+    assert filename.read_bytes() == content
+    assert not (tmp_path / 'quotes.csv.part').exists()
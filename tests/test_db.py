@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import pytest
+from peewee import DatabaseProxy
+
+from db import Database
+from models import DBConfig, Fund, FundLatestQuote, Quote, WebPage
+
+# Schema v1: funds and quotes with their scrapping time only
+SCHEMA_V1 = '''
+CREATE TABLE fund (id INTEGER PRIMARY KEY, name VARCHAR(200), bank VARCHAR(100),
+                   start_date DATETIME, created DATETIME NOT NULL, modified DATETIME NOT NULL);
+CREATE TABLE quote (id INTEGER PRIMARY KEY,
+                    fund_id INTEGER NOT NULL REFERENCES fund (id) ON DELETE CASCADE,
+                    value REAL NOT NULL, created DATETIME NOT NULL);
+CREATE TABLE db_config (key VARCHAR(64) NOT NULL UNIQUE, val VARCHAR(64),
+                        modified DATETIME NOT NULL);
+INSERT INTO db_config VALUES ('schema_version', '1', '2024-01-01 00:00:00');
+INSERT INTO fund VALUES (1, 'Acções', 'CGD', NULL, '2024-01-01', '2024-01-01');
+INSERT INTO quote VALUES (1, 1, 1.0, '2024-01-02 09:00:00');
+INSERT INTO quote VALUES (2, 1, 1.5, '2024-01-02 18:00:00');
+INSERT INTO quote VALUES (3, 1, 2.0, '2024-01-03 09:00:00');
+'''
+
+
+@pytest.fixture
+def open_database(tmp_path, args, monkeypatch):
+    """ Initialize Database on a new SQLite file, like a process starting """
+    monkeypatch.setattr(Database, 'DB', DatabaseProxy())
+    monkeypatch.setattr(args, 'db_name', str(tmp_path / 'quotes.db'))
+
+    def open_database():
+        Database()
+        return Database.DB
+
+    yield open_database
+    if Database.DB.obj is not None:
+        Database.DB.close_all()
+
+
+def test_new_database_is_created(open_database):
+    database = open_database()
+
+    with database.connection_context():
+        assert DBConfig.get_schema_version() == Database.SCHEMA_VERSION
+        assert all(model.table_exists() for model in Database.MODELS)
+
+
+def test_schema_v1_is_migrated(open_database, args):
+    with sqlite3.connect(args.db_name) as connection:
+        connection.executescript(SCHEMA_V1)
+
+    database = open_database()
+
+    with database.connection_context():
+        assert DBConfig.get_schema_version() == Database.SCHEMA_VERSION
+        assert WebPage.table_exists() and FundLatestQuote.table_exists()
+        # Latest quote of each day is kept, dated by its scrapping time
+        assert [(q.id, q.quote_date, q.value) for q in Quote.select().order_by(Quote.id)] == [
+            (2, date(2024, 1, 2), 1.5), (3, date(2024, 1, 3), 2.0)]
+
+        with pytest.raises(Exception, match='UNIQUE'):
+            Quote.create(fund=1, quote_date=date(2024, 1, 3), value=3)
+
+
+def test_newer_schema_is_rejected(open_database, args):
+    with sqlite3.connect(args.db_name) as connection:
+        connection.executescript(SCHEMA_V1.replace("'schema_version', '1'",
+                                                   "'schema_version', '99'"))
+
+    with pytest.raises(RuntimeError, match='Unsupported schema version: 99'):
+        open_database()
+
+    with Database.DB.connection_context():
+        assert 'quote_date' not in [c.name for c in Database.DB.get_columns('quote')]
+
+
+def test_sqlite_database_uses_wal(open_database, args):
+    database = open_database()
+
+    with database.connection_context():
+        assert database.journal_mode == 'wal'
+        assert database.foreign_keys == 1
+    assert os.path.exists(args.db_name)
+
+
+def test_sqlite_concurrent_writers_wait_for_the_lock(open_database):
+    database = open_database()
+    with database.connection_context():
+        fund = Fund.create(bank='CGD', name='Acções')
+
+    def write(day):
+        with database.connection_context():
+            with database.atomic():
+                # Read then write, deferred transactions would fail as busy
+                count = Quote.select().count()
+                Quote.create(fund=fund, quote_date=date(2024, 1, 1) + timedelta(days=day),
+                             value=count)
+
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(write, range(32)))
+
+    with database.connection_context():
+        assert sorted(q.value for q in Quote.select()) == list(range(32))
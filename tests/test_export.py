@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import csv
+import gzip
+from datetime import date
+
+import pytest
+
+from export import Exporter
+from models import Fund, Quote
+
+
+@pytest.fixture
+def exporter(database, args, tmp_path, monkeypatch):
+    monkeypatch.setattr(args, 'export_path', str(tmp_path / 'exports'))
+    monkeypatch.setattr(args, 'export_format', 'csv')
+    monkeypatch.setattr(args, 'export_chunk_size', 2)
+    return Exporter
+
+
+def add_quotes(fund, days):
+    Quote.insert_many([{'fund': fund, 'quote_date': date(2024, 1, day), 'value': day}
+                       for day in days]).execute()
+
+
+def exported_ids(path):
+    ids = []
+    for filename in sorted(path.glob('bank=*/month=*/part-*.csv.gz')):
+        with gzip.open(filename, 'rt', encoding='utf-8', newline='') as file:
+            ids.extend(int(row['id']) for row in csv.DictReader(file))
+
+    return ids
+
+
+def test_incremental_export(exporter, tmp_path):
+    fund = Fund.create(bank='CGD', name='Acções')
+    add_quotes(fund, range(1, 6))
+    assert exporter().run() == 5
+    add_quotes(fund, range(6, 9))
+    assert exporter().run() == 3
+    assert exporter().run() == 0
+
+    assert sorted(exported_ids(tmp_path / 'exports')) == list(range(1, 9))
+
+
+def test_full_export_replaces_previous_files(exporter, tmp_path):
+    fund = Fund.create(bank='CGD', name='Acções')
+    add_quotes(fund, range(1, 6))
+    exporter().run()
+    add_quotes(fund, range(6, 9))
+    exporter().run()
+    # Left over by an interrupted full export
+    (tmp_path / 'exports.full').mkdir()
+    (tmp_path / 'exports.full' / 'stale').touch()
+
+    assert exporter().run(full=True) == 8
+
+    assert sorted(exported_ids(tmp_path / 'exports')) == list(range(1, 9))
+    assert not (tmp_path / 'exports.full').exists()
+    assert not (tmp_path / 'exports.previous').exists()
+    # Next incremental export continues after the full one
+    add_quotes(fund, [9])
+    assert exporter().run() == 1
+    assert sorted(exported_ids(tmp_path / 'exports')) == list(range(1, 10))
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from datetime import date
+
+import pytest
+
+from models import Fund, FundLatestQuote, Quote
+
+
+@pytest.fixture
+def funds(database):
+    funds = [Fund.create(bank='CGD', name=name) for name in ('Acções', 'Obrigações')]
+    Quote.insert_history([{'fund': fund.id, 'quote_date': date(2024, 1, 2), 'value': 1}
+                          for fund in funds], 100)
+    return funds
+
+
+def latest_values():
+    return [(row['fund'], row['value']) for row in Quote.latest_per_fund().dicts()]
+
+
+def test_table_is_not_used_until_enabled(funds):
+    assert not FundLatestQuote.is_enabled()
+    assert FundLatestQuote.select().count() == 0
+    assert latest_values() == [(funds[0].id, 1), (funds[1].id, 1)]
+
+
+def test_enable_builds_table(funds):
+    FundLatestQuote.enable()
+
+    assert FundLatestQuote.is_enabled()
+    assert FundLatestQuote.select().count() == 2
+
+
+def test_enabled_table_is_updated_by_new_quotes(funds):
+    FundLatestQuote.enable()
+
+    Quote.upsert_batch([{'fund': funds[0].id, 'quote_date': date(2024, 1, 3), 'value': 2}], 100)
+    Quote.insert_history([{'fund': funds[1].id, 'quote_date': date(2024, 1, 4), 'value': 3}],
+                         100)
+
+    assert latest_values() == [(funds[0].id, 2), (funds[1].id, 3)]
+    assert FundLatestQuote.get(FundLatestQuote.fund == funds[1].id).quote_date == date(2024, 1, 4)
+
+
+def test_older_quotes_do_not_replace_latest(funds):
+    FundLatestQuote.enable()
+
+    Quote.insert_history([{'fund': funds[0].id, 'quote_date': date(2023, 12, 29), 'value': 9}],
+                         100)
+
+    assert latest_values()[0] == (funds[0].id, 1)
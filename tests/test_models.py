@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from datetime import date, timedelta
+
+import pytest
+
+from models import DBConfig, Fund, Quote
+
+
+@pytest.fixture
+def quotes(database):
+    fund = Fund.create(bank='CGD', name='Acções')
+    Quote.insert_many([{'fund': fund.id, 'quote_date': date(2024, 1, 1) + timedelta(days=day),
+                        'value': day}
+                       for day in range(25)]).execute()
+    return fund
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 25, 100])
+def test_iter_all_returns_rows_in_key_order(quotes, chunk_size):
+    rows = list(Quote.iter_all(chunk_size=chunk_size))
+
+    assert [row['value'] for row in rows] == list(range(25))
+    assert rows == Quote.get_all()
+
+
+@pytest.mark.parametrize('row_type', ['dicts', 'tuples', 'namedtuples', 'objects'])
+def test_iter_all_row_types(quotes, row_type):
+    query = Quote.select(Quote.value, Quote.id)
+    rows = list(Quote.iter_all(chunk_size=4, row_type=row_type, query=query))
+
+    assert len(rows) == 25
+    if row_type == 'tuples':
+        assert rows[-1] == (24, rows[-1][1])
+    elif row_type == 'dicts':
+        assert rows[-1]['value'] == 24
+    else:
+        assert rows[-1].value == 24
+
+
+def test_iter_all_query_and_start_key(quotes):
+    query = Quote.select().where(Quote.value.in_(range(0, 25, 2)))
+    after = Quote.get(Quote.value == 10).id
+
+    values = [row['value'] for row in Quote.iter_all(chunk_size=2, query=query, after=after)]
+
+    assert values == [12, 14, 16, 18, 20, 22, 24]
+
+
+def test_iter_all_without_primary_key(database):
+    DBConfig.set_value('a', '1')
+    DBConfig.set_value('b', '2')
+
+    assert [row['key'] for row in DBConfig.iter_all(chunk_size=1)] == ['a', 'b']
+
+
+def test_iter_all_reads_one_chunk_per_query(quotes, database):
+    queries = []
+    execute_sql = database.execute_sql
+
+    def count_queries(sql, *args, **kwargs):
+        queries.append(sql)
+        return execute_sql(sql, *args, **kwargs)
+
+    database.execute_sql = count_queries
+    rows = Quote.iter_all(chunk_size=10)
+    next(rows)
+    assert len(queries) == 1
+
+    assert len(list(rows)) == 24
+    assert len(queries) == 3
+
+
+@pytest.mark.parametrize('limit', [1, 5, 25, 40])
+def test_get_random_returns_distinct_rows(quotes, limit):
+    rows = Quote.get_random(limit)
+
+    assert len(rows) == min(limit, 25)
+    assert len({row.id for row in rows}) == len(rows)
+
+
+def test_get_random_empty_table(database):
+    assert Quote.get_random(3) == []
+
+
+def test_get_random_respects_query(quotes):
+    query = Quote.select().where(Quote.value >= 20)
+
+    values = {row.value for row in Quote.get_random(3, query)}
+
+    assert len(values) == 3
+    assert values <= {20, 21, 22, 23, 24}
+
+
+def test_get_random_sparse_keys(quotes, monkeypatch):
+    # A single key far from the others, most probes miss
+    Quote.create(id=10 ** 9, fund=quotes, quote_date=date(2025, 1, 1), value=100)
+    monkeypatch.setattr(Quote, 'SAMPLE_ROUNDS', 1)
+    monkeypatch.setattr(Quote, 'SAMPLE_MAX_PROBES', 5)
+
+    rows = Quote.get_random(20)
+
+    assert len({row.id for row in rows}) == 20
+
+
+def test_sample_without_integer_key(database):
+    for key in 'abcde':
+        DBConfig.set_value(key, key)
+
+    rows = DBConfig.get_random(2)
+
+    assert len({row.key for row in rows}) == 2
+
+
+@pytest.mark.parametrize('sample', ['get_random', 'sample_stream'])
+def test_sample_is_uniform(quotes, sample):
+    counts = dict.fromkeys(range(25), 0)
+    for _ in range(500):
+        for row in getattr(Quote, sample)(5):
+            counts[row.value] += 1
+
+    # 100 draws of each row expected, bounds are 5 standard deviations away
+    assert min(counts.values()) > 55
+    assert max(counts.values()) < 145
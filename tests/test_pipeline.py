@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+
+import pytest
+
+from pipeline import Pipeline
+from scrapper import Scrapper, StagedScrapper
+
+log = logging.getLogger(__name__)
+
+
+class WordScrapper(StagedScrapper):
+    """ Counts the words of a fixed content """
+
+    def __init__(self, content):
+        StagedScrapper.__init__(self, name='Words')
+        self.content = content
+        self.stored = None
+
+    def fetch(self):
+        return self.content
+
+    @classmethod
+    def parse_content(cls, content, parser, parse_only=None, now=None):
+        log.warning(f'Parsing in process {os.getpid()}.')
+        if not content:
+            raise ValueError('Empty content.')
+        return content.split()
+
+    def store(self, parsed):
+        self.stored = parsed
+        return len(parsed)
+
+
+class PlainScrapper(Scrapper):
+
+    def __init__(self):
+        Scrapper.__init__(self, name='Plain')
+
+    def scrap(self):
+        return 0
+
+
+def test_staged_scrapper_requires_all_stages():
+    class FetchOnly(StagedScrapper):
+        def fetch(self):
+            return ''
+
+    with pytest.raises(TypeError, match='parse_content'):
+        FetchOnly(name='FetchOnly')
+
+
+def test_is_staged():
+    assert WordScrapper('').is_staged()
+    assert not PlainScrapper().is_staged()
+
+
+def test_scrap_runs_all_stages(database):
+    scrapper = WordScrapper('a b c')
+
+    assert scrapper.scrap() == 3
+    assert scrapper.stored == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('parse_workers', [0, 1])
+def test_pipeline_stores_parsed_content(database, caplog, parse_workers):
+    pipeline = Pipeline(fetch_workers=2, parse_workers=parse_workers, queue_size=1)
+    scrappers = [WordScrapper('a b'), WordScrapper(''), WordScrapper('a b c')]
+    try:
+        results = [pipeline.submit(scrapper).result(timeout=60) for scrapper in scrappers]
+    finally:
+        pipeline.close()
+
+    assert [r['status'] for r in results] == ['finished', 'failed', 'finished']
+    assert [r['result'] for r in results] == [2, None, 3]
+
+    # Records of the parser processes are handled by the loggers of this process
+    parsed = [r for r in caplog.records if r.getMessage().startswith('Parsing in process')]
+    assert len(parsed) == 3
+    assert all(r.name == __name__ for r in parsed)
+    in_process = [r.getMessage() == f'Parsing in process {os.getpid()}.' for r in parsed]
+    assert in_process == [not parse_workers] * 3
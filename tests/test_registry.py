@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from registry import Registry
+
+BASE_MODULE = '''
+from scrapper import Scrapper
+
+
+class BaseBank(Scrapper):
+    """ Not a scrapper, it has no bank """
+    PUBLISH_TIMES = ['08:00']
+    PARSER = 'lxml'
+
+
+class Alpha(BaseBank):
+    BANK = 'ALPHA'
+    URL = 'https://alpha.test/'
+
+    def scrap(self):
+        return 0
+
+
+class AlphaInvest(Alpha):
+    BANK = 'ALPHA-INVEST'
+    FREQUENCY = 3600
+
+
+class AlphaCopy(Alpha):
+    """ Same bank, not registered again """
+
+
+class HelperScrapper():
+    """ Unrelated class """
+'''
+
+OTHER_MODULE = '''
+from funds.alpha import Alpha
+
+
+class Beta(Alpha):
+    BANK = 'BETA'
+    PARSER = 'html.parser'
+    PUBLISH_TIMES = [hour for hour in ('09:00',)]
+'''
+
+
+@pytest.fixture
+def funds(tmp_path, monkeypatch):
+    package = tmp_path / 'funds'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'alpha.py').write_text(BASE_MODULE)
+    (package / 'beta.py').write_text(OTHER_MODULE)
+    (package / 'broken.py').write_text('class Broken(:\n')
+    monkeypatch.setattr(Registry, 'FUNDS_PATH', str(package))
+    return package
+
+
+def test_scan_finds_classes_declaring_a_bank(funds):
+    scrappers = Registry.scan()
+
+    assert sorted(scrappers) == ['ALPHA', 'ALPHA-INVEST', 'BETA']
+    assert scrappers['ALPHA-INVEST'].class_name == 'AlphaInvest'
+    assert scrappers['BETA'].module == 'funds.beta'
+
+
+def test_scan_inherits_literal_attributes(funds):
+    scrappers = Registry.scan()
+
+    alpha = scrappers['ALPHA']
+    assert (alpha.url, alpha.frequency, alpha.publish_times, alpha.parser) == (
+        'https://alpha.test/', None, ['08:00'], 'lxml')
+
+    invest = scrappers['ALPHA-INVEST']
+    assert (invest.url, invest.frequency, invest.publish_times) == (
+        'https://alpha.test/', 3600, ['08:00'])
+
+    # Not literal, inherited value is kept
+    beta = scrappers['BETA']
+    assert (beta.url, beta.parser, beta.publish_times) == (
+        'https://alpha.test/', 'html.parser', ['08:00'])
+
+
+def test_select_is_case_insensitive(funds):
+    assert [info.name for info in Registry.select(['beta', 'Alpha', 'gamma'])] == [
+        'BETA', 'ALPHA']
+
+
+def test_funds_package_declares_cgd():
+    info = Registry.scan()['CGD']
+
+    assert Registry.load(info).BANK == 'CGD'
+    assert info.publish_times == ['08:00']
+
+
+def test_app_does_not_import_scrapper_dependencies():
+    script = ('import sys, app; '
+              'print(*(m for m in ("aiohttp", "bs4", "requests") if m in sys.modules))')
+    root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True,
+                            text=True, check=True)
+
+    assert result.stdout.split() == []
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import gzip
+import os
+from datetime import datetime
+
+import pytest
+
+from archive import PageArchive
+from benchmarks.common import make_cgd_page
+from funds.cgd import CGD
+from models import Quote
+from replay import Replay
+
+URL = 'https://bank.test/quotes'
+
+
+def entry(url, content_hash):
+    return {'url': url, 'hash': content_hash}
+
+
+def test_archive_stores_each_content_once(tmp_path):
+    archive = PageArchive(str(tmp_path))
+    first = archive.record('CGD', URL, 'Cotação'.encode('cp1252'), 'cp1252')
+    archive.record('CGD', URL, 'Cotação'.encode('cp1252'), 'cp1252')
+    second = archive.record('CGD', URL, b'{}')
+
+    assert sorted(os.listdir(tmp_path / 'CGD')) == sorted(
+        ['index.jsonl', f'{first}.gz', f'{second}.gz'])
+    with gzip.open(tmp_path / 'CGD' / f'{first}.gz') as f:
+        assert f.read() == 'Cotação'.encode('cp1252')
+
+    entries = archive.entries('CGD')
+    assert [e['hash'] for e in entries] == [first, first, second]
+    assert all(isinstance(e['time'], datetime) for e in entries)
+    assert archive.read('CGD', entries[0]) == 'Cotação'
+    assert archive.read('CGD', entries[2]) == b'{}'
+
+
+def test_archive_skips_invalid_index_lines(tmp_path):
+    archive = PageArchive(str(tmp_path))
+    archive.record('CGD', URL, b'page')
+    with open(tmp_path / 'CGD' / 'index.jsonl', 'a', encoding='utf-8') as f:
+        f.write('{"url": "truncated\n')
+
+    assert len(archive.entries('CGD')) == 1
+    assert archive.entries('BPI') == []
+
+
+def test_unchanged_downloads_are_skipped():
+    entries = [entry(URL, 'a'), entry(URL, 'a'), entry(URL, 'b'), entry(URL, 'a'),
+               entry('https://bank.test/other', 'a')]
+
+    unique = Replay.unique_entries(entries)
+
+    assert unique == [entries[0], entries[2], entries[3], entries[4]]
+
+
+@pytest.fixture
+def replay_args(args, tmp_path, monkeypatch):
+    monkeypatch.setattr(args, 'banks', ['CGD'])
+    monkeypatch.setattr(args, 'replay_dry_run', False)
+    monkeypatch.setattr(args, 'backfill', False)
+    return args
+
+
+def quote_values():
+    return sorted(q.value for q in Quote.select())
+
+
+@pytest.mark.parametrize('parse_workers', [0, 1])
+def test_replay_stores_latest_page_content(database, replay_args, tmp_path, monkeypatch,
+                                           parse_workers):
+    monkeypatch.setattr(replay_args, 'scrapper_parse_workers', parse_workers)
+    now = datetime.utcnow()
+    first, second = make_cgd_page(3, now, seed=1), make_cgd_page(3, now, seed=2)
+
+    archive = PageArchive(str(tmp_path))
+    for page in (first, second, first):
+        archive.record('CGD', URL, page.encode(), 'utf-8')
+
+    replay = Replay(str(tmp_path))
+    assert replay.run() == 9
+    assert (replay.pages, replay.failed) == (3, 0)
+
+    # Back to the first page, its quotes prevail
+    _, quotes = CGD.parse_content(first, 'html.parser', now=now)
+    assert quote_values() == sorted(value for _, value, _ in quotes.values())
+
+
+def test_replay_dry_run_only_parses(database, replay_args, tmp_path, monkeypatch):
+    monkeypatch.setattr(replay_args, 'replay_dry_run', True)
+    monkeypatch.setattr(replay_args, 'scrapper_parse_workers', 0)
+    archive = PageArchive(str(tmp_path))
+    archive.record('CGD', URL, make_cgd_page(3).encode(), 'utf-8')
+
+    replay = Replay(str(tmp_path))
+
+    assert replay.run() == 0
+    assert replay.pages == 1
+    assert quote_values() == []
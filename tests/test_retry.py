@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import time
+
+import pytest
+from requests.exceptions import ConnectionError, HTTPError, MissingSchema, TooManyRedirects
+from requests.models import Response
+
+from models import WebPage
+from retry import CircuitBreaker, CircuitOpen, RetryPolicy
+from scrapper import PageNotModified, Scrapper
+
+
+def make_policy(retries=3, threshold=3, reset_timeout=60):
+    return RetryPolicy(retries=retries, backoff_factor=0.01, budget=60,
+                       threshold=threshold, reset_timeout=reset_timeout)
+
+
+def http_error(status, headers=None):
+    response = Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    return HTTPError(response=response)
+
+
+@pytest.mark.parametrize('error', [
+    ConnectionError(), asyncio.TimeoutError(), http_error(503), http_error(429)])
+def test_transient_errors_are_retried(error):
+    policy = make_policy()
+    retry = policy.start('http://bank.test/quotes')
+    retry.begin()
+
+    assert retry.failure(error) == pytest.approx(0.01)
+    assert policy.metrics['retries'] == 1
+
+
+@pytest.mark.parametrize('error', [
+    MissingSchema(), TooManyRedirects(), http_error(404), ValueError()])
+def test_permanent_errors_are_not_retried(error):
+    policy = make_policy(threshold=1)
+    retry = policy.start('http://bank.test/quotes')
+    retry.begin()
+
+    assert retry.failure(error) is None
+    assert policy.breaker('http://bank.test/').state == CircuitBreaker.CLOSED
+
+
+def test_retry_after_header_extends_backoff():
+    policy = make_policy()
+    retry = policy.start('http://bank.test/quotes')
+    retry.begin()
+
+    assert retry.failure(http_error(503, {'Retry-After': '2'})) == 2.0
+
+
+def test_attempts_are_limited():
+    policy = make_policy(retries=2, threshold=10)
+    retry = policy.start('http://bank.test/quotes')
+    retry.begin()
+    assert retry.failure(ConnectionError()) is not None
+    retry.begin()
+
+    assert retry.failure(ConnectionError()) is None
+    assert policy.metrics['exhausted'] == 1
+
+
+def test_circuit_opens_after_consecutive_failures():
+    policy = make_policy(retries=10, threshold=2)
+    retry = policy.start('http://bank.test/quotes')
+    retry.begin()
+    retry.failure(ConnectionError())
+    retry.begin()
+
+    assert retry.failure(ConnectionError()) is None
+    with pytest.raises(CircuitOpen):
+        policy.start('http://bank.test/other').begin()
+    assert policy.get_stats()['open_circuits'] == ['bank.test']
+
+
+def test_half_open_circuit_closes_on_success():
+    breaker = CircuitBreaker('bank.test', threshold=1, reset_timeout=0)
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_probe_is_closed_by_non_host_errors():
+    policy = make_policy(threshold=1, reset_timeout=0)
+    retry = policy.start('http://bank.test/quotes')
+    retry.begin()
+    retry.failure(ConnectionError())
+    assert policy.breaker('http://bank.test/').state == CircuitBreaker.OPEN
+
+    retry = policy.start('http://bank.test/quotes')
+    retry.begin()
+    assert retry.failure(ValueError('Invalid JSON')) is None
+    assert policy.breaker('http://bank.test/').state == CircuitBreaker.CLOSED
+
+
+def test_unresolved_probe_is_replaced():
+    breaker = CircuitBreaker('bank.test', threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    time.sleep(0.05)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    time.sleep(0.05)
+    assert breaker.allow()
+
+
+class PlainScrapper(Scrapper):
+
+    def __init__(self):
+        Scrapper.__init__(self, name='Plain')
+
+    def scrap(self):
+        return None
+
+
+def test_unchanged_page_probe_closes_circuit(database, http_server):
+    def respond(request):
+        if len(http_server.requests) == 1:
+            return 503, b'', {}
+        return 200, b'quotes', {'Content-Type': 'text/html'}
+
+    http_server.respond = respond
+    url = http_server.url('/quotes')
+    WebPage.save_page(url, None, None, WebPage.hash(b'quotes'))
+    scrapper = PlainScrapper()
+    scrapper.retry_policy = make_policy(retries=1, threshold=1, reset_timeout=0)
+
+    assert scrapper.request_url(url, cache=True) is None
+    assert scrapper.retry_policy.breaker(url).state == CircuitBreaker.OPEN
+
+    # Probe gets back the unchanged page
+    with pytest.raises(PageNotModified):
+        scrapper.request_url(url, cache=True)
+    assert scrapper.retry_policy.breaker(url).state == CircuitBreaker.CLOSED
+
+    with pytest.raises(PageNotModified):
+        scrapper.request_url(url, cache=True)
+    assert len(http_server.requests) == 3
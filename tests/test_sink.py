@@ -0,0 +1,147 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import json
+import time
+from datetime import date
+
+import pytest
+from peewee import IntegrityError, OperationalError
+
+from models import Fund, Quote, WebPage
+from scrapper import Scrapper
+from sink import QuoteSink
+
+
+@pytest.fixture
+def fund(database):
+    return Fund.create(bank='CGD', name='Acções')
+
+
+@pytest.fixture
+def sink(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(QuoteSink, 'BACKOFF', 0.01)
+    sink = QuoteSink(batch_size=100, interval=0.01, spill_path=str(tmp_path))
+    sink.start()
+    yield sink
+    if sink.is_alive():
+        sink.close()
+
+
+def quote(fund, day, value=1.0):
+    return {'fund': fund.id, 'quote_date': date(2024, 1, day), 'value': value}
+
+
+def fail_writes(monkeypatch, error, times):
+    """ Make the next writes of quotes fail """
+    upsert_batch = Quote.upsert_batch
+    failures = []
+
+    def failing_upsert(rows, batch_size):
+        if len(failures) < times:
+            failures.append(rows)
+            raise error
+        return upsert_batch(rows, batch_size)
+
+    monkeypatch.setattr(Quote, 'upsert_batch', staticmethod(failing_upsert))
+    return failures
+
+
+def test_quotes_and_pages_are_written_on_close(sink, fund):
+    assert sink.submit([quote(fund, 2)]) is None
+    sink.submit([quote(fund, 1, 2.0)], history=True)
+    sink.submit_pages({'http://bank.test/': {
+        'etag': 'v1', 'last_modified': None, 'content_hash': 'abc'}})
+    sink.close()
+
+    assert Quote.select().count() == 2
+    assert WebPage.get_page('http://bank.test/').etag == 'v1'
+    assert sink.written == 2
+
+
+def test_failed_writes_are_kept_for_the_next_flush(sink, fund, monkeypatch):
+    failures = fail_writes(monkeypatch, OperationalError('database is locked'), 5)
+    sink.submit([quote(fund, 2)])
+    sink.submit_pages({'http://bank.test/': {
+        'etag': 'v1', 'last_modified': None, 'content_hash': 'abc'}})
+
+    deadline = time.monotonic() + 10
+    while not sink.written and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert len(failures) == 5
+    assert Quote.select().count() == 1
+    # Validators are only saved along with their quotes
+    assert WebPage.get_page('http://bank.test/').etag == 'v1'
+    assert sink.spilled == 0
+
+
+def test_last_flush_is_retried_before_saving_to_a_file(sink, fund, monkeypatch, tmp_path):
+    failures = fail_writes(monkeypatch, OperationalError('database is locked'), 100)
+    sink.submit([quote(fund, 2)])
+    sink.close()
+
+    assert len(failures) == QuoteSink.RETRIES
+    assert sink.spilled == 1
+    assert len(list(tmp_path.glob('quote-sink-*.json'))) == 1
+
+
+def test_failing_quotes_are_saved_to_a_file(sink, fund, monkeypatch, tmp_path):
+    fail_writes(monkeypatch, IntegrityError('FOREIGN KEY constraint failed'), 100)
+    sink.submit([quote(fund, 2)])
+    sink.submit_pages({'http://bank.test/': {
+        'etag': 'v1', 'last_modified': None, 'content_hash': 'abc'}})
+    sink.close()
+
+    assert Quote.select().count() == 0
+    assert WebPage.get_page('http://bank.test/') is None
+    assert sink.spilled == 1
+
+    files = list(tmp_path.glob('quote-sink-*.json'))
+    assert len(files) == 1
+    assert json.loads(files[0].read_text()) == {
+        'quotes': [{'fund': fund.id, 'quote_date': '2024-01-02', 'value': 1.0}],
+        'history': []}
+
+
+def test_closed_sink_rejects_quotes(sink, fund):
+    sink.close()
+
+    with pytest.raises(RuntimeError, match='closed'):
+        sink.submit([quote(fund, 2)])
+
+
+def test_stopped_sink_rejects_quotes(database, fund, tmp_path):
+    sink = QuoteSink(batch_size=100, interval=0.01, spill_path=str(tmp_path))
+
+    with pytest.raises(RuntimeError, match='not running'):
+        sink.submit([quote(fund, 2)])
+
+
+class PlainScrapper(Scrapper):
+
+    def __init__(self):
+        Scrapper.__init__(self, name='Plain')
+
+    def scrap(self):
+        return None
+
+
+def test_scrapper_counts_only_written_quotes(fund):
+    scrapper = PlainScrapper()
+    scrapper.begin_run()
+
+    assert scrapper.save_quotes([quote(fund, 2)]) == 1
+    assert scrapper.save_quotes([quote(fund, 2), quote(fund, 3)], history=True) == 1
+
+    QuoteSink.start_sink()
+    try:
+        assert scrapper.save_quotes([quote(fund, 4)]) is None
+        scrapper.pages['http://bank.test/'] = {
+            'etag': 'v1', 'last_modified': None, 'content_hash': 'abc'}
+        scrapper.finish_run(None)
+    finally:
+        QuoteSink.stop_sink()
+
+    assert Quote.select().count() == 3
+    assert WebPage.get_page('http://bank.test/').etag == 'v1'
@@ -10,8 +10,8 @@ import struct
 import sys
 import time
 
+from datetime import date, datetime, timedelta
 from timeit import default_timer as timer
-import requests
 
 log = logging.getLogger(__name__)
 
@@ -127,6 +127,9 @@ def validate_ip(ip):
 
 
 def find_local_ip(proxy_judge):
+    # Imported on use, the application loads HTTP clients with the scrappers
+    import requests
+
     r = requests.get(proxy_judge)
     r.raise_for_status()
     response = r.text
@@ -143,6 +146,8 @@ def find_local_ip(proxy_judge):
 
 
 def query_ipify():
+    import requests
+
     r = requests.get('https://api.ipify.org/?format=json')
     r.raise_for_status()
     response = r.json()
@@ -162,6 +167,32 @@ def random_ip():
     return int2ip(random.randint(1, 0xffffffff))
 
 
+def previous_business_day(day):
+    """ Weekday before the given date """
+    day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+
+    return day
+
+
+def month_start(day, months=0):
+    """ First day of the month, optionally offset by a number of months """
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def parse_date(text, formats=('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y')):
+    """ Parse a date trying each one of the formats """
+    for date_format in formats:
+        try:
+            return datetime.strptime(text.strip(), date_format)
+        except ValueError:
+            continue
+
+    raise ValueError(f'Unknown date format: {text}')
+
+
 def http_headers(keep_alive=False):
     """
     Browser base HTTP request headers.